@@ -1,10 +1,69 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
 import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import qrcode
 from PIL import ImageTk, Image
+import tkinter.filedialog as filedialog
 import tkinter.messagebox as messagebox
 import tkinter.ttk as ttk
 import pyperclip
 
+BOX_SIZE = 10
+BORDER = 4
+ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L  # Use default error correction (L)
+QR_CACHE_BYTES = 64 * 1024 * 1024
+PHOTO_CACHE_BYTES = 32 * 1024 * 1024
+PREVIEW_DELAY_MS = 150
+PREVIEW_POLL_MS = 20
+
+class QRCache:
+    # LRU of QR matrices and rendered images, or of preview photos, evicted
+    # by their estimated memory rather than by count. Shared with the preview
+    # thread, hence the lock.
+    def __init__(self, max_bytes=QR_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+qr_cache = QRCache()
+# Only ever touched on the Tk thread: evicting a PhotoImage deletes its Tk
+# image, which must not happen from the preview thread
+photo_cache = QRCache(PHOTO_CACHE_BYTES)
+
 
 def generate_qr_code():
     text = entry.get("1.0", tk.END).strip()
@@ -18,36 +77,70 @@ def generate_qr_code():
         return
 
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,  # Use default error correction (L)
-            box_size=10,
-            border=4
-        )
-        qr.add_data(text)
-        qr.make(fit=True)
-
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-
-        size = size_var.get()
-        if size != 100:
-            qr_image = resize_qr_code(qr_image, size)
+        qr_image = build_qr_image(text, size_var.get())
 
         save_filename = save_filename_var.get()
         if save_filename:
             save_qr_image(qr_image, save_filename)
 
-        qr_photo = ImageTk.PhotoImage(qr_image)
+        qr_photo = qr_photo_for(text, size_var.get(), qr_image)
         label.config(image=qr_photo)
         label.image = qr_photo
 
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred while generating QR code:\n{str(e)}")
 
-def resize_qr_code(qr_image, size_percent):
-    new_size = int(qr_image.size[0] * (size_percent / 100))
-    resized_qr_image = qr_image.resize((new_size, new_size), Image.ANTIALIAS)
-    return resized_qr_image
+def module_scale(size_percent):
+    # Pixels per module for a resize percentage: whole pixels only, so every
+    # module stays a crisp square instead of being resampled
+    return max(1, round(BOX_SIZE * size_percent / 100))
+
+def image_size(image):
+    # PIL keeps 1 byte per pixel for "1" and "L" images and 4 for the rest
+    return image.width * image.height * (1 if image.mode in ("1", "L") else 4)
+
+def qr_matrix(text, error_correction=ERROR_CORRECTION, cache=qr_cache):
+    # The code as a one-pixel-per-module image, border included
+    key = ("matrix", text, error_correction)
+    matrix_image = cache.get(key) if cache is not None else None
+    if matrix_image is None:
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=error_correction,
+            box_size=1,
+            border=BORDER
+        )
+        qr.add_data(text)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        modules = len(matrix)
+        pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+        matrix_image = Image.frombytes("L", (modules, modules), pixels).convert("1")
+        if cache is not None:
+            cache.put(key, matrix_image, image_size(matrix_image))
+    return matrix_image
+
+def build_qr_image(text, size_percent=100, error_correction=ERROR_CORRECTION, cache=qr_cache):
+    # Rendered at its final size in one step: nearest-neighbour scaling by a
+    # whole number of pixels per module. Cached images are shared, so callers
+    # must not modify them.
+    scale = module_scale(size_percent)
+    key = ("image", text, error_correction, scale)
+    qr_image = cache.get(key) if cache is not None else None
+    if qr_image is None:
+        matrix_image = qr_matrix(text, error_correction, cache)
+        qr_image = matrix_image.resize((matrix_image.width * scale, matrix_image.height * scale), Image.NEAREST)
+        if cache is not None:
+            cache.put(key, qr_image, image_size(qr_image))
+    return qr_image
+
+def qr_photo_for(text, size_percent, qr_image):
+    # Tk photo for a preview; Tk stores 4 bytes per pixel
+    key = ("photo", text, ERROR_CORRECTION, module_scale(size_percent))
+    qr_photo = photo_cache.get(key)
+    if qr_photo is None:
+        qr_photo = photo_cache.put(key, ImageTk.PhotoImage(qr_image), qr_image.width * qr_image.height * 4)
+    return qr_photo
 
 def save_qr_image(qr_image, filename):
     try:
@@ -79,43 +172,312 @@ def clear_text():
 def on_entry_return(event):
     generate_qr_code()
 
-window = tk.Tk()
-window.title("QR Code Generator")
+def schedule_preview(*args):
+    # Any edit or size change restarts the delay, so only the text the user
+    # pauses on gets rendered
+    global preview_after_id
+    if entry.edit_modified():
+        entry.edit_modified(False)
+    if not live_preview_var.get():
+        return
+    if preview_after_id is not None:
+        window.after_cancel(preview_after_id)
+    preview_after_id = window.after(PREVIEW_DELAY_MS, request_preview)
+
+def request_preview():
+    global preview_after_id, preview_generation, preview_polling
+    preview_after_id = None
+    preview_generation += 1
+    text = entry.get("1.0", tk.END).strip()
+    size = size_var.get()
+    if not text:
+        show_preview(None, "")
+        return
+    cached = qr_cache.get(("image", text, ERROR_CORRECTION, module_scale(size)))
+    if cached is not None:
+        show_preview(qr_photo_for(text, size, cached), "")
+        return
+    preview_requests.put((preview_generation, text, size))
+    if not preview_polling:
+        preview_polling = True
+        window.after(PREVIEW_POLL_MS, poll_preview)
+
+def preview_worker():
+    # Renders on its own thread; requests that were superseded while it was
+    # busy are skipped, and only the newest one is rendered
+    while True:
+        request = preview_requests.get()
+        while not preview_requests.empty():
+            request = preview_requests.get_nowait()
+        generation, text, size = request
+        try:
+            preview_results.put((generation, text, size, build_qr_image(text, size), ""))
+        except Exception as e:
+            preview_results.put((generation, text, size, None, str(e)))
+
+def poll_preview():
+    # Results are picked up on the Tk thread, and stale ones are dropped.
+    # Polling stops once the preview is up to date.
+    global preview_polling
+    while not preview_results.empty():
+        generation, text, size, qr_image, error = preview_results.get_nowait()
+        if generation == preview_generation:
+            show_preview(qr_photo_for(text, size, qr_image) if qr_image is not None else None, error)
+    if preview_shown == preview_generation:
+        preview_polling = False
+    else:
+        window.after(PREVIEW_POLL_MS, poll_preview)
+
+def show_preview(qr_photo, message):
+    global preview_shown
+    preview_shown = preview_generation
+    if qr_photo is None:
+        qr_photo = ImageTk.PhotoImage(Image.new("RGB", (200, 200), color="white"))
+    label.config(image=qr_photo)
+    label.image = qr_photo
+    preview_status_var.set(message)
+
+def toggle_live_preview():
+    if live_preview_var.get():
+        schedule_preview()
+    else:
+        preview_status_var.set("")
+
+def batch_filename(save_name, index):
+    # "tickets.png" becomes tickets_000001.png, tickets_000002.png, ...
+    stem, extension = os.path.splitext(os.path.basename(save_name or "qr.png"))
+    return f"{stem or 'qr'}_{index:06d}{extension or '.png'}"
+
+def read_payloads(input_path, save_name="qr.png"):
+    # Yields (filename, payload) one at a time. Text files have one payload
+    # per line; CSV files have the payload in the first column and an
+    # optional output filename in the second.
+    with open(input_path, "r", encoding="utf-8", newline="") as input_file:
+        if input_path.lower().endswith(".csv"):
+            rows = csv.reader(input_file)
+        else:
+            rows = ([line.rstrip("\r\n")] for line in input_file)
+        index = 0
+        for row in rows:
+            if not row or not row[0].strip():
+                continue
+            if index == 0 and row[0].strip().lower() == "payload":
+                continue
+            index += 1
+            filename = os.path.basename(row[1].strip()) if len(row) > 1 and row[1].strip() else ""
+            yield filename or batch_filename(save_name, index), row[0]
+
+def save_qr_batch(jobs, output_dir, size_percent):
+    # Runs in a worker process; returns only the failures, so results stay small
+    errors = []
+    for filename, text in jobs:
+        try:
+            build_qr_image(text, size_percent, cache=None).save(os.path.join(output_dir, filename))
+        except Exception as e:
+            errors.append(f"{filename}: {e}")
+    return len(jobs), errors
+
+def generate_batch(input_path, output_dir, size_percent=100, save_name="qr.png", workers=None, batch_size=64,
+                   progress=None, cancelled=None):
+    # Streams payloads to a process pool a batch at a time. At most two
+    # batches per worker are in flight, so memory stays flat however long
+    # the input is. Workers are spawned rather than forked, which is safe
+    # from a process that has a Tk window and other threads.
+    workers = workers or os.cpu_count() or 1
+    total = sum(1 for _ in read_payloads(input_path, save_name))
+    os.makedirs(output_dir, exist_ok=True)
+    done = 0
+    errors = []
+    started = time.perf_counter()
+    payloads = read_payloads(input_path, save_name)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 2 and not (cancelled and cancelled.is_set()):
+                jobs = [job for _, job in zip(range(batch_size), payloads)]
+                if jobs:
+                    pending.add(executor.submit(save_qr_batch, jobs, output_dir, size_percent))
+                exhausted = len(jobs) < batch_size
+            if cancelled and cancelled.is_set():
+                exhausted = True
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                count, batch_errors = future.result()
+                done += count
+                errors += batch_errors
+            if progress:
+                progress(done, len(errors), total, time.perf_counter() - started)
+    seconds = time.perf_counter() - started
+    return {"total": total, "done": done, "failed": len(errors), "errors": errors[:20], "seconds": seconds,
+            "rate": done / seconds if seconds else 0.0}
+
+def format_progress(done, failed, total, seconds):
+    rate = done / seconds if seconds else 0.0
+    return f"{done}/{total} codes, {failed} failed, {rate:.0f} codes/s"
+
+def start_batch():
+    input_path = filedialog.askopenfilename(title="Payload File",
+                                            filetypes=[("Text or CSV", "*.txt *.csv"), ("All Files", "*")])
+    if not input_path:
+        return
+    output_dir = filedialog.askdirectory(title="Output Folder")
+    if not output_dir:
+        return
+
+    # The batch runs on a thread and reports through a queue that the Tk
+    # loop polls, since Tk must only be touched from the main thread
+    updates = queue.Queue()
+    batch_cancelled.clear()
+
+    def run():
+        try:
+            stats = generate_batch(input_path, output_dir, size_var.get(), save_filename_var.get(),
+                                   progress=lambda *args: updates.put(("progress", args)),
+                                   cancelled=batch_cancelled)
+            updates.put(("done", stats))
+        except Exception as e:
+            updates.put(("error", str(e)))
+
+    batch_button.config(state=tk.DISABLED)
+    cancel_batch_button.config(state=tk.NORMAL)
+    batch_status_var.set("Starting batch...")
+    threading.Thread(target=run, daemon=True).start()
+    window.after(100, poll_batch, updates)
+
+def poll_batch(updates):
+    try:
+        while True:
+            kind, value = updates.get_nowait()
+            if kind == "progress":
+                batch_status_var.set(format_progress(*value))
+            else:
+                batch_button.config(state=tk.NORMAL)
+                cancel_batch_button.config(state=tk.DISABLED)
+                if kind == "error":
+                    batch_status_var.set("")
+                    messagebox.showerror("Error", f"An error occurred while generating QR codes:\n{value}")
+                else:
+                    batch_status_var.set(format_progress(value["done"], value["failed"], value["total"],
+                                                         value["seconds"]))
+                    if value["errors"]:
+                        messagebox.showwarning("Warning", "Some QR codes could not be generated:\n" +
+                                               "\n".join(value["errors"]))
+                return
+    except queue.Empty:
+        pass
+    window.after(100, poll_batch, updates)
+
+def cancel_batch():
+    batch_cancelled.set()
+    batch_status_var.set("Cancelling...")
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="QR code generator; opens the window unless --batch is given")
+    parser.add_argument("--batch", metavar="INPUT", help="text file (one payload per line) or CSV "
+                                                         "(payload[,filename]) to generate codes from")
+    parser.add_argument("--output-dir", default=".", help="folder for the generated images (default: .)")
+    parser.add_argument("--size", type=int, default=100, help="resize percentage, 10-200 (default: 100)")
+    parser.add_argument("--save-name", default="qr.png",
+                        help="filename template; qr.png gives qr_000001.png, ... (default: qr.png)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=64, help="payloads per worker task (default: 64)")
+    args = parser.parse_args(argv)
+    if not 10 <= args.size <= 200:
+        parser.error("--size must be between 10 and 200")
+    return args
+
+def run_batch(args):
+    def report(done, failed, total, seconds):
+        print(f"\r{format_progress(done, failed, total, seconds)}", end="", file=sys.stderr, flush=True)
+
+    stats = generate_batch(args.batch, args.output_dir, args.size, args.save_name, args.workers, args.batch_size,
+                           progress=report)
+    print(file=sys.stderr)
+    for error in stats["errors"]:
+        print(error, file=sys.stderr)
+    print(f"Generated {stats['done'] - stats['failed']} of {stats['total']} QR codes in {stats['seconds']:.2f}s "
+          f"({stats['rate']:.0f} codes/s)")
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    arguments = parse_arguments(sys.argv[1:])
+    if arguments.batch:
+        sys.exit(run_batch(arguments))
+
+    window = tk.Tk()
+    window.title("QR Code Generator")
+
+    entry = tk.Text(window, height=5, wrap=tk.WORD)
+    entry.pack(padx=10, pady=10)
+
+    options_frame = ttk.LabelFrame(window, text="Options")
+    options_frame.pack(padx=10, pady=5)
+
+    size_label = ttk.Label(options_frame, text="Resize QR Code (%):")
+    size_label.grid(row=0, column=0, sticky="w")
+
+    size_var = tk.IntVar()
+    size_var.set(100)
+
+    size_scale = tk.Scale(options_frame, from_=10, to=200, variable=size_var, orient=tk.HORIZONTAL)
+    size_scale.grid(row=0, column=1, padx=10)
+
+    save_filename_label = ttk.Label(options_frame, text="Save Filename:")
+    save_filename_label.grid(row=1, column=0, sticky="w")
+
+    save_filename_var = tk.StringVar()
+    save_filename_entry = ttk.Entry(options_frame, textvariable=save_filename_var)
+    save_filename_entry.grid(row=1, column=1, padx=10)
+
+    live_preview_var = tk.BooleanVar()
+    live_preview_check = ttk.Checkbutton(options_frame, text="Live Preview", variable=live_preview_var,
+                                         command=toggle_live_preview)
+    live_preview_check.grid(row=2, column=0, columnspan=2, sticky="w")
 
-entry = tk.Text(window, height=5, wrap=tk.WORD)
-entry.pack(padx=10, pady=10)
+    generate_button = ttk.Button(window, text="Generate QR Code", command=generate_qr_code)
+    generate_button.pack(pady=10)
 
-options_frame = ttk.LabelFrame(window, text="Options")
-options_frame.pack(padx=10, pady=5)
+    label = ttk.Label(window)
+    label.pack()
 
-size_label = ttk.Label(options_frame, text="Resize QR Code (%):")
-size_label.grid(row=0, column=0, sticky="w")
+    preview_status_var = tk.StringVar()
+    preview_status_label = ttk.Label(window, textvariable=preview_status_var)
+    preview_status_label.pack()
 
-size_var = tk.IntVar()
-size_var.set(100)
+    copy_image_button = ttk.Button(window, text="Copy QR Code Image", command=copy_qr_image)
+    copy_image_button.pack(pady=5)
 
-size_scale = tk.Scale(options_frame, from_=10, to=200, variable=size_var, orient=tk.HORIZONTAL)
-size_scale.grid(row=0, column=1, padx=10)
+    clear_button = ttk.Button(window, text="Clear Text", command=clear_text)
+    clear_button.pack(pady=5)
 
-save_filename_label = ttk.Label(options_frame, text="Save Filename:")
-save_filename_label.grid(row=1, column=0, sticky="w")
+    batch_frame = ttk.LabelFrame(window, text="Batch")
+    batch_frame.pack(padx=10, pady=5, fill=tk.X)
 
-save_filename_var = tk.StringVar()
-save_filename_entry = ttk.Entry(options_frame, textvariable=save_filename_var)
-save_filename_entry.grid(row=1, column=1, padx=10)
+    batch_button = ttk.Button(batch_frame, text="Generate From File...", command=start_batch)
+    batch_button.grid(row=0, column=0, padx=5, pady=5)
 
-generate_button = ttk.Button(window, text="Generate QR Code", command=generate_qr_code)
-generate_button.pack(pady=10)
+    cancel_batch_button = ttk.Button(batch_frame, text="Cancel", command=cancel_batch, state=tk.DISABLED)
+    cancel_batch_button.grid(row=0, column=1, padx=5, pady=5)
 
-label = ttk.Label(window)
-label.pack()
+    batch_status_var = tk.StringVar()
+    batch_status_label = ttk.Label(batch_frame, textvariable=batch_status_var)
+    batch_status_label.grid(row=1, column=0, columnspan=2, sticky="w", padx=5)
 
-copy_image_button = ttk.Button(window, text="Copy QR Code Image", command=copy_qr_image)
-copy_image_button.pack(pady=5)
+    batch_cancelled = threading.Event()
 
-clear_button = ttk.Button(window, text="Clear Text", command=clear_text)
-clear_button.pack(pady=5)
+    preview_after_id = None
+    preview_generation = 0
+    preview_shown = 0
+    preview_polling = False
+    preview_requests = queue.Queue()
+    preview_results = queue.Queue()
+    threading.Thread(target=preview_worker, daemon=True).start()
+    entry.bind("<<Modified>>", schedule_preview)
+    size_var.trace_add("write", schedule_preview)
 
-entry.bind("<Return>", on_entry_return)
+    entry.bind("<Return>", on_entry_return)
 
-window.mainloop()
+    window.mainloop()
@@ -1,216 +1,2757 @@
-from PySide6.QtWidgets import QApplication, QDialog, QVBoxLayout, QLabel, QPushButton, QRadioButton, QLineEdit, \
-    QMessageBox, QTableWidget, QTableWidgetItem, QFileDialog
-from PySide6.QtGui import QPixmap
-import qrcode
-from PIL import Image
-from io import BytesIO
-import csv
-from datetime import datetime
-import random
-import os
-import hashlib
-
-class PaymentDialog(QDialog):
-    def __init__(self, parent=None):
-        super(PaymentDialog, self).__init__(parent)
-
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Payment Options')
-
-        self.layout = QVBoxLayout()
-
-        self.label = QLabel('Choose Payment Method:')
-        self.layout.addWidget(self.label)
-
-        self.student_card_radio = QRadioButton('Student Card')
-        self.cash_radio = QRadioButton('Cash')
-        self.qr_radio = QRadioButton('QR Code')
-
-        self.layout.addWidget(self.student_card_radio)
-        self.layout.addWidget(self.cash_radio)
-        self.layout.addWidget(self.qr_radio)
-
-        self.amount_label = QLabel('Enter Amount:')
-        self.layout.addWidget(self.amount_label)
-
-        self.amount_input = QLineEdit(self)
-        self.layout.addWidget(self.amount_input)
-
-        self.pay_button = QPushButton('Pay')
-        self.pay_button.clicked.connect(self.process_payment)
-        self.layout.addWidget(self.pay_button)
-
-        # QLabel to display the QR code image
-        self.qr_label = QLabel(self)
-        self.layout.addWidget(self.qr_label)
-
-        # Button to show payment history
-        self.show_history_button = QPushButton('Show History')
-        self.show_history_button.clicked.connect(self.show_payment_history)
-        self.layout.addWidget(self.show_history_button)
-
-        self.setLayout(self.layout)
-
-    def process_payment(self):
-        amount = self.amount_input.text()
-        if not amount:
-            self.show_error_message('Please enter the payment amount.')
-            return
-
-        try:
-            amount = float(amount)
-        except ValueError:
-            self.show_error_message('Invalid amount. Please enter a numeric value.')
-            return
-
-        if self.student_card_radio.isChecked():
-            self.execute_student_card_payment(amount)
-        elif self.cash_radio.isChecked():
-            self.execute_cash_payment(amount)
-        elif self.qr_radio.isChecked():
-            self.execute_qr_payment(amount)
-        else:
-            self.show_error_message('Please select a payment method.')
-
-    def execute_student_card_payment(self, amount):
-        if amount > 0:
-            bill_id = self.generate_bill_id()
-            self.save_transaction('Student Card', amount, bill_id)
-            print(f'Student Card Payment of {amount} with Bill ID {bill_id} executed successfully.')
-        else:
-            self.show_error_message('Invalid amount for student card payment.')
-
-    def execute_cash_payment(self, amount):
-        if amount > 0:
-            bill_id = self.generate_bill_id()
-            self.save_transaction('Cash', amount, bill_id)
-            print(f'Cash Payment of {amount} with Bill ID {bill_id} received.')
-        else:
-            self.show_error_message('Invalid amount for cash payment.')
-
-    def execute_qr_payment(self, amount):
-        if amount > 0:
-            data = self.generate_qr_data(amount)
-            self.generate_qr_data(data)
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=6,
-                border=4,
-            )
-            qr.add_data(data)
-            qr.make(fit=True)
-
-            img = qr.make_image(fill_color="black", back_color="white")
-
-            img_byte_array = BytesIO()
-            img.save(img_byte_array, format='PNG')
-            img_byte_array = img_byte_array.getvalue()
-            pixmap = QPixmap()
-            pixmap.loadFromData(img_byte_array)
-
-            self.qr_label.setPixmap(pixmap)
-            self.qr_label.setScaledContents(True)
-
-            bill_id = self.generate_bill_id()
-            self.save_transaction('QR Code', amount, bill_id)
-            self.export_to_csv()  # Automatically export to CSV after each payment
-            print(f'QR Code Payment of {amount} with Bill ID {bill_id} processed successfully.')
-        else:
-            self.show_error_message('Invalid amount for QR code payment.')
-
-    def generate_qr_data(self, amount):
-        # Generate QR code data with a secure hash
-        bill_id = self.generate_bill_id()
-        secure_hash = hashlib.sha256(f'Payment: Amount: {amount} BillID: {bill_id}'.encode()).hexdigest()
-        return f'Payment: Amount: {amount} BillID: {bill_id} Hash: {secure_hash}'
-
-    def generate_bill_id(self):
-        return f'{random.randint(100000, 999999)}'
-
-    def save_transaction(self, method, amount, bill_id):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        file_path = 'transaction_records.csv'
-
-        if not os.path.isfile(file_path):
-            with open(file_path, 'w', newline='') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow(['Method', 'Amount', 'Bill ID', 'Timestamp'])
-
-        with open(file_path, 'a', newline='') as csvfile:
-            csv_writer = csv.writer(csvfile)
-            csv_writer.writerow([method, amount, bill_id, timestamp])
-
-    def show_error_message(self, message):
-        msg_box = QMessageBox()
-        msg_box.setIcon(QMessageBox.Warning)
-        msg_box.setWindowTitle('Error')
-        msg_box.setText(message)
-        msg_box.exec_()
-
-    def show_payment_history(self):
-        # Create a new dialog to display payment history
-        history_dialog = QDialog(self)
-        history_dialog.setWindowTitle('Payment History')
-
-        # Create a table widget
-        table_widget = QTableWidget()
-        table_widget.setColumnCount(4)
-        table_widget.setHorizontalHeaderLabels(['Method', 'Amount', 'Bill ID', 'Timestamp'])
-
-        # Load data from CSV and populate the table
-        file_path = 'transaction_records.csv'
-        if os.path.isfile(file_path):
-            with open(file_path, 'r') as csvfile:
-                csv_reader = csv.reader(csvfile)
-                next(csv_reader)  # Skip header row
-                for row in csv_reader:
-                    table_widget.insertRow(table_widget.rowCount())
-                    for col, value in enumerate(row):
-                        item = QTableWidgetItem(value)
-                        table_widget.setItem(table_widget.rowCount() - 1, col, item)
-
-        # Create a layout for the history dialog
-        history_layout = QVBoxLayout()
-        history_layout.addWidget(table_widget)
-
-        # Set the layout for the history dialog
-        history_dialog.setLayout(history_layout)
-
-        # Show the history dialog
-        history_dialog.exec_()
-
-    def export_to_csv(self):
-        # Get the data from the table widget
-        data = []
-        header = ['Method', 'Amount', 'Bill ID', 'Timestamp']
-        data.append(header)
-        
-        # Append the latest transaction data
-        latest_transaction = self.get_latest_transaction()
-        data.append(latest_transaction)
-
-        # Save the data to the CSV file
-        file_path = 'payment_history.csv'
-        with open(file_path, 'a', newline='') as csvfile:
-            csv_writer = csv.writer(csvfile)
-            csv_writer.writerows(data)
-
-    def get_latest_transaction(self):
-        # Get the latest transaction data from the original CSV file
-        file_path = 'transaction_records.csv'
-        if os.path.isfile(file_path):
-            with open(file_path, 'r') as csvfile:
-                csv_reader = csv.reader(csvfile)
-                rows = list(csv_reader)
-                if len(rows) > 1:  # Ensure there is at least one transaction (header row + data)
-                    return rows[-1]
-        return []
-
-if __name__ == '__main__':
-    app = QApplication([])
-    dialog = PaymentDialog()
-    dialog.show()
-    app.exec()
+from PySide6.QtWidgets import QApplication, QDialog, QVBoxLayout, QLabel, QPushButton, QRadioButton, QLineEdit, \
+    QMessageBox, QTableWidget, QTableWidgetItem, QFileDialog, QTableView, QHeaderView, QHBoxLayout, QComboBox
+from PySide6.QtGui import QPixmap, QImage, QShortcut, QKeySequence
+from PySide6.QtCore import QTimer, Qt, QAbstractTableModel, QModelIndex, QObject, QThreadPool, Signal
+import qrcode
+from PIL import Image
+import csv
+from datetime import datetime, timedelta
+import os
+import hashlib
+import time
+import atexit
+import mmap
+import sqlite3
+import argparse
+import sys
+from collections import deque, OrderedDict
+from functools import partial
+from contextlib import nullcontext
+import numpy as np
+import json
+import itertools
+import re
+import glob
+import threading
+import signal
+import fcntl
+import socket
+import socketserver
+import queue
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import Future, ProcessPoolExecutor
+
+LEDGER_PATH = 'transaction_records.csv'
+LEDGER_HEADER = ['Method', 'Amount', 'Bill ID', 'Timestamp']
+DATABASE_PATH = 'transactions.db'
+PAYMENT_METHODS = ['Student Card', 'Cash', 'QR Code']
+EXPORT_PATH = 'payment_history.csv'
+METRICS_PATH = 'payment_metrics.json'
+SOCKET_PATH = 'ledger.sock'
+QR_PAYLOAD_PATTERN = re.compile(r'Payment: Amount: (\S+) BillID: (\S+) Hash: ([0-9a-f]{64})')
+
+
+def read_tail_rows(file_path, count, block_size=8192):
+    # Read the last `count` data rows by seeking backwards from the end of the
+    # file, so the cost depends on the rows wanted and not on the ledger size
+    if count <= 0 or not os.path.isfile(file_path):
+        return []
+
+    with open(file_path, 'rb') as ledger_file:
+        position = ledger_file.seek(0, os.SEEK_END)
+        data = b''
+        # One extra line so a partial first line (or the header) can be dropped
+        while position > 0 and data.count(b'\n') <= count + 1:
+            step = min(block_size, position)
+            position -= step
+            ledger_file.seek(position)
+            data = ledger_file.read(step) + data
+
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    if position > 0:
+        lines = lines[1:]
+    rows = [row for row in csv.reader(lines) if row]
+    if position == 0 and rows and rows[0] == LEDGER_HEADER:
+        rows = rows[1:]
+    return rows[-count:]
+
+
+ARCHIVE_MAGIC = b'TXARCH01'
+
+# Held while closed segments are renamed/removed and while readers list and
+# open them, so a reader never sees a segment disappear underneath it
+segment_lock = threading.Lock()
+
+
+def segment_root(file_path):
+    return os.path.splitext(file_path)[0]
+
+
+def segment_order(stem):
+    # Sort key of a segment stem <root>.<YYYYmmdd-HHMMSS>[-<counter>]: the
+    # timestamp, then the collision counter as a number, so -10 follows -9
+    parts = stem.rsplit('.', 1)[-1].split('-')
+    counter = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    return '-'.join(parts[:2]), counter
+
+
+def closed_segments(file_path):
+    # Closed (rotated) segments of a ledger, oldest first. A segment is its
+    # columnar archive once compacted, or its CSV while compaction is pending.
+    segments = {}
+    for path in glob.glob(glob.escape(segment_root(file_path)) + '.[0-9]*'):
+        stem, extension = os.path.splitext(path)
+        if extension == '.col' or (extension == '.csv' and stem not in segments):
+            segments[stem] = path
+    return [segments[stem] for stem in sorted(segments, key=segment_order)]
+
+
+def stamp_to_text(stamp):
+    stamp = int(stamp)
+    return (f'{stamp // 10000000000:04d}-{stamp // 100000000 % 100:02d}-{stamp // 1000000 % 100:02d} '
+            f'{stamp // 10000 % 100:02d}:{stamp // 100 % 100:02d}:{stamp % 100:02d}')
+
+
+def write_archive(archive_path, rows):
+    # Columnar archive of closed ledger rows:
+    #   magic | uint32 header length | JSON header | columns (8-byte aligned)
+    # Amounts are float64 and timestamps int64 YYYYMMDDHHMMSS (fixed width),
+    # methods are dictionary-encoded into uint8 codes and bill IDs are stored
+    # as an offsets array plus one byte blob.
+    methods = sorted({row[0] for row in rows})
+    method_codes = {method: code for code, method in enumerate(methods)}
+    bills = [row[2].encode('utf-8') for row in rows]
+    bill_offsets = np.zeros(len(rows) + 1, dtype='<u8')
+    np.cumsum([len(bill) for bill in bills], out=bill_offsets[1:])
+    columns = [
+        ('amount', np.array([float(row[1]) for row in rows], dtype='<f8')),
+        ('stamp', np.array([stamp_from_text(row[3]) for row in rows], dtype='<i8')),
+        ('method', np.array([method_codes[row[0]] for row in rows],
+                            dtype=np.uint8 if len(methods) <= 256 else '<u2')),
+        ('bill_offsets', bill_offsets),
+        ('bill_data', np.frombuffer(b''.join(bills), dtype=np.uint8)),
+    ]
+
+    layout, offset = {}, 0
+    for name, values in columns:
+        layout[name] = [offset, values.dtype.str, len(values)]
+        offset += (values.nbytes + 7) // 8 * 8
+    header = json.dumps({'rows': len(rows), 'methods': methods, 'columns': layout}).encode('utf-8')
+    data_start = (len(ARCHIVE_MAGIC) + 4 + len(header) + 7) // 8 * 8
+
+    temp_path = archive_path + '.tmp'
+    with open(temp_path, 'wb') as archive_file:
+        archive_file.write(ARCHIVE_MAGIC + len(header).to_bytes(4, 'little') + header)
+        for name, values in columns:
+            archive_file.seek(data_start + layout[name][0])
+            archive_file.write(values.tobytes())
+        archive_file.truncate(data_start + offset)
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+    os.replace(temp_path, archive_path)
+
+
+class ArchiveSegment:
+    # Reader for one columnar archive. Columns are memory-mapped, so opening
+    # is cheap, rows can be fetched by number and scans stay vectorised.
+    def __init__(self, archive_path):
+        self.path = archive_path
+        with open(archive_path, 'rb') as archive_file:
+            if archive_file.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f'{archive_path} is not a ledger archive.')
+            header_length = int.from_bytes(archive_file.read(4), 'little')
+            header = json.loads(archive_file.read(header_length))
+        data_start = (len(ARCHIVE_MAGIC) + 4 + header_length + 7) // 8 * 8
+
+        self.rows = header['rows']
+        self.methods = header['methods']
+        self.columns = {}
+        for name, (offset, dtype, count) in header['columns'].items():
+            if count:
+                self.columns[name] = np.memmap(archive_path, dtype=dtype, mode='r',
+                                               offset=data_start + offset, shape=(count,))
+            else:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+
+    def row_count(self):
+        return self.rows
+
+    def row(self, row_number):
+        offsets = self.columns['bill_offsets']
+        bill = bytes(self.columns['bill_data'][int(offsets[row_number]):int(offsets[row_number + 1])])
+        return [self.methods[self.columns['method'][row_number]], repr(float(self.columns['amount'][row_number])),
+                bill.decode('utf-8'), stamp_to_text(self.columns['stamp'][row_number])]
+
+    def iter_rows(self):
+        for row_number in range(self.rows):
+            yield self.row(row_number)
+
+    def load_columns(self):
+        return {'methods': list(self.methods), 'method': self.columns['method'].astype(np.int32),
+                'amount': np.asarray(self.columns['amount']), 'stamp': np.asarray(self.columns['stamp'])}
+
+    def match(self, method=None, bill_id=None, start=None, end=None):
+        # Row numbers matching the filters, computed on the columns
+        mask = np.ones(self.rows, dtype=bool)
+        if method is not None:
+            if method not in self.methods:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self.columns['method'] == self.methods.index(method)
+        if start is not None:
+            mask &= self.columns['stamp'] >= stamp_from_text(start)
+        if end is not None:
+            mask &= self.columns['stamp'] < stamp_from_text(end)
+        if bill_id is not None:
+            needle = np.frombuffer(bill_id.encode('utf-8'), dtype=np.uint8)
+            offsets = self.columns['bill_offsets']
+            mask &= (offsets[1:] - offsets[:-1]) == len(needle)
+            candidates = np.flatnonzero(mask)
+            if len(needle) and len(candidates):
+                stored = self.columns['bill_data'][offsets[candidates].astype(np.int64)[:, None] + np.arange(len(needle))]
+                candidates = candidates[(stored == needle).all(axis=1)]
+            return candidates
+        return np.flatnonzero(mask)
+
+    def match_bills(self, bill_ids):
+        # Row numbers whose Bill ID is any of bill_ids, compared a byte length
+        # at a time as fixed-width records on the columns
+        offsets = self.columns['bill_offsets']
+        lengths = offsets[1:] - offsets[:-1]
+        wanted = {}
+        for bill_id in set(bill_ids):
+            needle = bill_id.encode('utf-8')
+            wanted.setdefault(len(needle), []).append(needle)
+        matches = []
+        for length, needles in wanted.items():
+            candidates = np.flatnonzero(lengths == length)
+            if not length or not len(candidates):
+                continue
+            stored = self.columns['bill_data'][offsets[candidates].astype(np.int64)[:, None] + np.arange(length)]
+            records = np.ascontiguousarray(stored).view(f'S{length}').ravel()
+            matches.append(candidates[np.isin(records, np.array(needles, dtype=f'S{length}'))])
+        return np.sort(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+
+    def close(self):
+        self.columns = {}
+
+
+def compact_segments(file_path):
+    # Turn every closed CSV segment of a ledger into a columnar archive. The
+    # archive is written to a temporary file and renamed into place before the
+    # CSV is removed, so an interrupted compaction is simply redone later.
+    for segment_path in closed_segments(file_path):
+        if not segment_path.endswith('.csv'):
+            continue
+        with open(segment_path, 'r', newline='') as csvfile:
+            rows = [row for row in csv.reader(csvfile) if len(row) >= 4 and row != LEDGER_HEADER]
+        archive_path = os.path.splitext(segment_path)[0] + '.col'
+        write_archive(archive_path, rows)
+        with segment_lock:
+            os.remove(segment_path)
+
+
+def open_segments(file_path):
+    # Row sources for every closed segment, oldest first
+    with segment_lock:
+        sources = []
+        for segment_path in closed_segments(file_path):
+            if segment_path.endswith('.col'):
+                sources.append(ArchiveSegment(segment_path))
+            else:
+                with open(segment_path, 'r', newline='') as csvfile:
+                    rows = [row for row in csv.reader(csvfile) if len(row) >= 4 and row != LEDGER_HEADER]
+                sources.append(ListRowSource(rows))
+        return sources
+
+
+def complete_lines(text_file):
+    # Lines of a file that is being appended to; a last line still being
+    # written (no newline yet) is left for the next read
+    for line in text_file:
+        if not line.endswith('\n'):
+            return
+        yield line
+
+
+def iter_live_rows(file_path):
+    # Data rows of the live CSV segment
+    if os.path.isfile(file_path):
+        with open(file_path, 'r', newline='') as csvfile:
+            csv_reader = csv.reader(complete_lines(csvfile))
+            next(csv_reader, None)  # Skip header row
+            for row in csv_reader:
+                if row:
+                    yield row
+
+
+def iter_ledger_rows(file_path):
+    # Stream every row of a ledger across its closed segments and live file
+    for source in open_segments(file_path):
+        if isinstance(source, ArchiveSegment):
+            yield from source.iter_rows()
+        else:
+            yield from source.rows
+    yield from iter_live_rows(file_path)
+
+
+class LedgerWriter:
+    # Keeps one append handle on the ledger for its whole lifetime and commits
+    # rows in groups, so a payment never pays for open/stat/close calls.
+    #   flush_interval: seconds a row may wait in memory before it is committed
+    #                   (0 commits every row as soon as it is appended)
+    #   batch_size:     commit as soon as this many rows are pending
+    #   fsync:          'always' fsyncs every commit, 'interval' at most once
+    #                   per fsync_interval seconds, 'never' leaves it to the OS
+    #   recent_size:    how many of the newest rows are kept in memory
+    #   rotate_bytes:   start a new segment once the file reaches this size
+    #   rotate_daily:   start a new segment when the day of the rows changes
+    #   on_rotate:      called after each rotation
+    # Closed segments are renamed to <name>.<YYYYmmdd-HHMMSS>.csv and compacted
+    # into columnar archives (<name>.<...>.col) on a background thread.
+    FSYNC_POLICIES = ('always', 'interval', 'never')
+
+    def __init__(self, file_path=LEDGER_PATH, flush_interval=0.5, batch_size=64,
+                 fsync='always', fsync_interval=5.0, recent_size=100,
+                 rotate_bytes=None, rotate_daily=False, on_rotate=None):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy: {fsync}')
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.on_rotate = on_rotate
+        self.compaction_thread = None
+        self.compaction_again = False
+
+        self.pending = []
+        self.last_commit = time.monotonic()
+        self.last_fsync = self.last_commit
+
+        # Newest rows, served from memory; seeded from the end of the file on
+        # a cold start instead of reading the whole ledger
+        self.recent = deque(read_tail_rows(file_path, recent_size), maxlen=recent_size)
+        # Day of the last row in the live segment, for daily rotation
+        self.segment_day = self.recent[-1][3][:10] if self.recent and len(self.recent[-1]) > 3 else None
+
+        self.open_file()
+
+        # Finish compacting segments left over from an interrupted run
+        if rotate_bytes or rotate_daily:
+            self.start_compaction()
+
+        # Make sure pending rows reach the disk if the process dies on an
+        # unhandled exception or exits without closing the dialog
+        atexit.register(self.close)
+
+    def open_file(self):
+        self.file = open(self.file_path, 'a', newline='', buffering=1 << 16)
+        self.csv_writer = csv.writer(self.file)
+        # An existing but empty ledger still needs its header row
+        if self.file.tell() == 0:
+            self.csv_writer.writerow(LEDGER_HEADER)
+            self.commit()
+
+    @property
+    def closed(self):
+        return self.file is None
+
+    def generation(self):
+        # Identifies the live segment; changes on every rotation
+        return os.fstat(self.file.fileno()).st_ino
+
+    def needs_rotation(self, row):
+        if self.rotate_daily and self.segment_day is not None and len(row) > 3 and str(row[3])[:10] != self.segment_day:
+            return True
+        return bool(self.rotate_bytes) and self.file.tell() >= self.rotate_bytes
+
+    def rotate(self):
+        # Close the live segment under a timestamped name and start a new one
+        self.commit()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        stem = f'{segment_root(self.file_path)}.{datetime.now().strftime("%Y%m%d-%H%M%S")}'
+        segment_path, counter = stem + '.csv', 1
+        while os.path.exists(segment_path) or os.path.exists(os.path.splitext(segment_path)[0] + '.col'):
+            segment_path = f'{stem}-{counter:04d}.csv'
+            counter += 1
+        with segment_lock:
+            os.replace(self.file_path, segment_path)
+
+        self.segment_day = None
+        self.open_file()
+        if self.on_rotate is not None:
+            self.on_rotate()
+        self.start_compaction()
+
+    def start_compaction(self):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            # The running pass picks up the new segment when it loops again
+            self.compaction_again = True
+            return
+        self.compaction_again = False
+        self.compaction_thread = threading.Thread(target=self.compact, name='ledger-compaction')
+        self.compaction_thread.start()
+
+    def compact(self):
+        while True:
+            try:
+                compact_segments(self.file_path)
+            except (OSError, ValueError) as e:
+                print(f'Could not compact ledger segments of {self.file_path}: {e}')
+            if not self.compaction_again:
+                return
+            self.compaction_again = False
+
+    def append(self, row):
+        if self.closed:
+            raise ValueError('Ledger writer is closed.')
+        # Rotation happens before the new row, so every row already handed to
+        # the writer (and counted by its caller) lands in the closed segment
+        if (self.rotate_bytes or self.rotate_daily) and self.needs_rotation(row):
+            self.rotate()
+        if len(row) > 3:
+            self.segment_day = str(row[3])[:10]
+        self.pending.append(row)
+        self.recent.append([str(value) for value in row])
+        if len(self.pending) >= self.batch_size or self.flush_interval <= 0:
+            self.commit()
+        else:
+            self.flush_if_due()
+
+    def latest(self):
+        return list(self.recent[-1]) if self.recent else []
+
+    def tail(self, count):
+        if count <= len(self.recent):
+            return [list(row) for row in list(self.recent)[len(self.recent) - count:]]
+        # Asked for more than we keep in memory: fall back to the file, and
+        # from there back through the closed segments, newest first
+        self.flush()
+        rows = read_tail_rows(self.file_path, count)
+        for source in reversed(open_segments(self.file_path) if len(rows) < count else []):
+            first = max(0, source.row_count() - (count - len(rows)))
+            rows = [source.row(row_number) for row_number in range(first, source.row_count())] + rows
+            source.close()
+            if len(rows) >= count:
+                break
+        return rows
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.last_commit >= self.flush_interval:
+            self.commit()
+
+    def flush(self):
+        if not self.closed:
+            self.commit()
+
+    def commit(self):
+        if self.pending:
+            self.csv_writer.writerows(self.pending)
+            self.pending = []
+        self.file.flush()
+
+        now = time.monotonic()
+        self.last_commit = now
+        if self.fsync == 'always' or (self.fsync == 'interval' and now - self.last_fsync >= self.fsync_interval):
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.commit()
+            if self.fsync != 'never':
+                os.fsync(self.file.fileno())
+        finally:
+            self.file.close()
+            self.file = None
+            atexit.unregister(self.close)
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+
+
+class LedgerView:
+    # Rows of the ledger as indexed at one moment, parsed a page at a time
+    # from a memory map. A view owns its file handle and map, so closing it
+    # never affects the index it came from or any other view.
+    PAGE_SIZE = 256
+
+    def __init__(self, ledger_file=None, offsets=None, indexed_end=0, max_cached_pages=64):
+        self.max_cached_pages = max_cached_pages
+        self.ledger_file = ledger_file
+        self.map = mmap.mmap(ledger_file.fileno(), 0, access=mmap.ACCESS_READ) if ledger_file is not None else None
+        self.offsets = offsets if offsets is not None else np.zeros(0, dtype=np.uint64)
+        self.indexed_end = indexed_end
+        self.pages = OrderedDict()
+
+    def row_count(self):
+        return len(self.offsets)
+
+    def read_rows(self, start, count):
+        stop = min(start + count, self.row_count())
+        if start >= stop:
+            return []
+        first = int(self.offsets[start])
+        last = int(self.offsets[stop]) if stop < self.row_count() else self.indexed_end
+        lines = self.map[first:last].decode('utf-8', errors='replace').splitlines()
+        return list(csv.reader(lines))
+
+    def row(self, row_number):
+        page_number = row_number // self.PAGE_SIZE
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.read_rows(page_number * self.PAGE_SIZE, self.PAGE_SIZE)
+            self.pages[page_number] = page
+            if len(self.pages) > self.max_cached_pages:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_number)
+        return page[row_number % self.PAGE_SIZE]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.ledger_file is not None:
+            self.ledger_file.close()
+            self.ledger_file = None
+
+
+class LedgerIndex(LedgerView):
+    # Byte-offset index over the ledger, persisted next to it as
+    # <ledger>.idx. The index file is a flat uint64 array: slot 0 holds the
+    # offset up to which the ledger has been indexed, the remaining slots hold
+    # the start offset of every data row. Reopening only indexes rows that
+    # were appended since the last time. History views are handed out with
+    # view(), each over its own map.
+    def __init__(self, file_path=LEDGER_PATH, max_cached_pages=64):
+        super().__init__(max_cached_pages=max_cached_pages)
+        self.file_path = file_path
+        self.index_path = file_path + '.idx'
+        self.inode = None
+
+        self.load_index()
+
+    def load_index(self):
+        if os.path.isfile(self.index_path):
+            stored = np.fromfile(self.index_path, dtype=np.uint64)
+            if len(stored):
+                self.indexed_end = int(stored[0])
+                self.offsets = stored[1:]
+
+    def reset_index(self):
+        self.offsets = np.zeros(0, dtype=np.uint64)
+        self.indexed_end = 0
+        if os.path.isfile(self.index_path):
+            os.remove(self.index_path)
+
+    def refresh(self):
+        # Remap the ledger and index whatever has been appended since last time
+        self.close()
+        self.pages.clear()
+
+        size = os.path.getsize(self.file_path) if os.path.isfile(self.file_path) else 0
+        # A ledger that shrank (or was replaced) invalidates the stored offsets
+        if size < self.indexed_end:
+            self.reset_index()
+        if size == 0:
+            return
+
+        self.ledger_file = open(self.file_path, 'rb')
+        # A ledger that was rotated away since the last refresh starts over
+        inode = os.fstat(self.ledger_file.fileno()).st_ino
+        if self.inode is not None and inode != self.inode:
+            self.reset_index()
+        self.inode = inode
+        self.map = mmap.mmap(self.ledger_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.indexed_end and self.map[self.indexed_end - 1:self.indexed_end] != b'\n':
+            self.reset_index()
+
+        # Only complete lines are indexed; a half-written last row waits
+        end = self.map.rfind(b'\n') + 1
+        if end <= self.indexed_end:
+            return
+
+        chunk = np.frombuffer(self.map, dtype=np.uint8, count=end - self.indexed_end, offset=self.indexed_end)
+        line_starts = np.flatnonzero(chunk == ord('\n')).astype(np.uint64) + np.uint64(self.indexed_end + 1)
+        del chunk
+        if self.indexed_end == 0:
+            # The first line is the header; data rows start after it
+            new_offsets = line_starts[:-1]
+        else:
+            new_offsets = np.concatenate(([np.uint64(self.indexed_end)], line_starts[:-1]))
+
+        self.offsets = np.concatenate((self.offsets, new_offsets))
+        self.indexed_end = end
+        self.save_index(new_offsets)
+
+    def save_index(self, new_offsets):
+        if not os.path.isfile(self.index_path) or len(self.offsets) == len(new_offsets):
+            with open(self.index_path, 'wb') as index_file:
+                np.array([self.indexed_end], dtype=np.uint64).tofile(index_file)
+                self.offsets.tofile(index_file)
+            return
+        with open(self.index_path, 'r+b') as index_file:
+            index_file.seek(0, os.SEEK_END)
+            new_offsets.tofile(index_file)
+            index_file.seek(0)
+            np.array([self.indexed_end], dtype=np.uint64).tofile(index_file)
+
+    def view(self):
+        # Independent view of the rows indexed so far. It maps a duplicate of
+        # the index's file handle, so it keeps reading the same file even if
+        # the ledger rotates before it is closed.
+        if self.ledger_file is None:
+            return LedgerView(max_cached_pages=self.max_cached_pages)
+        return LedgerView(open(os.dup(self.ledger_file.fileno()), 'rb'), self.offsets, self.indexed_end,
+                          self.max_cached_pages)
+
+
+class ListRowSource:
+    # Row source over rows that are already in memory (e.g. a filtered scan)
+    def __init__(self, rows):
+        self.rows = rows
+
+    def row_count(self):
+        return len(self.rows)
+
+    def row(self, row_number):
+        return self.rows[row_number]
+
+    def close(self):
+        pass
+
+
+def row_matches(row, method=None, bill_id=None, start=None, end=None):
+    # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS', so string order is time order
+    return ((method is None or row[0] == method) and
+            (bill_id is None or row[2] == bill_id) and
+            (start is None or row[3] >= start) and
+            (end is None or row[3] < end))
+
+
+class SegmentedRowSource:
+    # Row source that chains the sources of several segments end to end
+    def __init__(self, sources):
+        self.sources = sources
+        self.starts = np.cumsum([0] + [source.row_count() for source in sources])
+
+    def row_count(self):
+        return int(self.starts[-1])
+
+    def row(self, row_number):
+        segment = int(np.searchsorted(self.starts, row_number, side='right')) - 1
+        return self.sources[segment].row(row_number - int(self.starts[segment]))
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+def merge_columns(parts):
+    # Concatenate columnar loads, re-mapping each part's method codes onto
+    # one shared dictionary
+    methods = sorted(set().union(*(part['methods'] for part in parts)))
+    code_of = {method: code for code, method in enumerate(methods)}
+    method_columns = []
+    for part in parts:
+        mapping = np.array([code_of[method] for method in part['methods']] or [0], dtype=np.int32)
+        method_columns.append(mapping[part['method']])
+    return {
+        'methods': methods,
+        'method': np.concatenate(method_columns) if parts else np.zeros(0, dtype=np.int32),
+        'amount': np.concatenate([part['amount'] for part in parts]) if parts else np.zeros(0),
+        'stamp': np.concatenate([part['stamp'] for part in parts]) if parts else np.zeros(0, dtype=np.int64),
+    }
+
+
+class CsvLedgerReader:
+    # Read-only access to a CSV ledger and its segments. It only reads rows
+    # that are already committed, so it can run on another thread (or in
+    # another process) while a LedgerWriter appends.
+    def __init__(self, file_path=LEDGER_PATH):
+        self.file_path = file_path
+        self.index = LedgerIndex(file_path)
+
+    @property
+    def path(self):
+        return self.file_path
+
+    def load_columns(self, start=None, end=None):
+        # Everything is loaded; compute_aggregates applies the range
+        parts = []
+        for source in open_segments(self.file_path):
+            if isinstance(source, ArchiveSegment):
+                parts.append(source.load_columns())
+            elif source.row_count():
+                parts.append(columns_from_rows(source.rows))
+        parts.append(load_ledger_columns(self.file_path))
+        return merge_columns(parts)
+
+    def scan(self):
+        return iter_ledger_rows(self.file_path)
+
+    def query(self, method=None, bill_id=None, start=None, end=None):
+        # Archives are filtered on their columns; only CSV has to be parsed
+        rows = []
+        for source in open_segments(self.file_path):
+            if isinstance(source, ArchiveSegment):
+                rows.extend(source.row(row_number) for row_number in source.match(method, bill_id, start, end))
+            else:
+                rows.extend(row for row in source.rows if row_matches(row, method, bill_id, start, end))
+        rows.extend(row for row in iter_live_rows(self.file_path) if row_matches(row, method, bill_id, start, end))
+        return rows
+
+    def find_bill(self, bill_id):
+        # Legacy random IDs can repeat; the latest row wins, as in find_bills
+        rows = self.query(bill_id=bill_id)
+        return rows[-1] if rows else None
+
+    def find_bills(self, bill_ids):
+        # Bill ID -> row for many bills. Archives are matched on their
+        # columns; only the CSV segments and live file are parsed
+        wanted = set(bill_ids)
+        rows = {}
+        for source in open_segments(self.file_path):
+            if isinstance(source, ArchiveSegment):
+                matches = (source.row(row_number) for row_number in source.match_bills(wanted))
+            else:
+                matches = (row for row in source.rows if row[2] in wanted)
+            rows.update((row[2], row) for row in matches)
+        rows.update((row[2], row) for row in iter_live_rows(self.file_path) if len(row) > 2 and row[2] in wanted)
+        return rows
+
+    def history(self, method=None, bill_id=None, start=None, end=None):
+        if method is None and bill_id is None and start is None and end is None:
+            self.index.refresh()
+            view = self.index.view()
+            segments = open_segments(self.file_path)
+            return SegmentedRowSource(segments + [view]) if segments else view
+        return ListRowSource(self.query(method, bill_id, start, end))
+
+    def close(self):
+        self.index.close()
+
+
+class CsvTransactionStore(CsvLedgerReader):
+    # Storage backend over transaction_records.csv. Appends are group-committed
+    # by LedgerWriter and the unfiltered history is served by LedgerIndex.
+    # With rotation enabled, closed segments are compacted into columnar
+    # archives and every read streams across archives and the live file.
+    # Reads commit pending rows first, so they always see every append.
+    def __init__(self, file_path=LEDGER_PATH, **writer_options):
+        super().__init__(file_path)
+        self.rotate_listeners = []
+        self.ledger = LedgerWriter(file_path, on_rotate=self.on_rotate, **writer_options)
+
+    def on_rotate(self):
+        # The live file starts over, so its offset index does too
+        self.index.close()
+        self.index.reset_index()
+        for listener in self.rotate_listeners:
+            listener()
+
+    def open_reader(self):
+        # A separate read-only handle for another thread
+        return CsvLedgerReader(self.file_path)
+
+    @property
+    def flush_interval(self):
+        return self.ledger.flush_interval
+
+    def append(self, row):
+        self.ledger.append(row)
+
+    def position(self):
+        # Live segment and byte offset of everything committed so far
+        self.ledger.flush()
+        return [self.ledger.generation(), self.ledger.file.tell()]
+
+    def rows_since(self, position):
+        # Rows committed after `position`, plus the new position. Returns None
+        # for the rows if `position` is not in the live segment (it rotated
+        # away, or the file was replaced).
+        end_position = self.position()
+        if not isinstance(position, list) or position[0] != end_position[0] or position[1] > end_position[1]:
+            return None, end_position
+        position, end = position[1], end_position[1]
+        with open(self.file_path, 'rb') as ledger_file:
+            ledger_file.seek(position)
+            data = ledger_file.read(end - position)
+        rows = [row for row in csv.reader(data.decode('utf-8', errors='replace').splitlines()) if row]
+        if position == 0 and rows and rows[0] == LEDGER_HEADER:
+            rows = rows[1:]
+        return rows, end_position
+
+    def load_columns(self, start=None, end=None):
+        self.ledger.flush()
+        return super().load_columns(start, end)
+
+    def latest(self):
+        return self.ledger.latest()
+
+    def tail(self, count):
+        return self.ledger.tail(count)
+
+    def flush(self):
+        self.ledger.flush()
+
+    def flush_if_due(self):
+        self.ledger.flush_if_due()
+
+    def scan(self):
+        self.ledger.flush()
+        return super().scan()
+
+    def query(self, method=None, bill_id=None, start=None, end=None):
+        self.ledger.flush()
+        return super().query(method, bill_id, start, end)
+
+    def find_bills(self, bill_ids):
+        self.ledger.flush()
+        return super().find_bills(bill_ids)
+
+    def history(self, method=None, bill_id=None, start=None, end=None):
+        self.ledger.flush()
+        return super().history(method, bill_id, start, end)
+
+    def close(self):
+        self.ledger.close()
+        super().close()
+
+
+class SqliteRowSource:
+    # Row source over the transactions table. Only the matching row ids are
+    # fetched up front (from an index); full rows are loaded a page at a time.
+    PAGE_SIZE = 256
+
+    def __init__(self, connection, ids=None, max_cached_pages=64):
+        self.connection = connection
+        self.max_cached_pages = max_cached_pages
+        self.pages = OrderedDict()
+        if ids is None:
+            # Unfiltered: ids are 1..N, nothing needs to be materialised
+            self.ids = None
+            self.count = connection.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+        else:
+            self.ids = ids
+            self.count = len(ids)
+
+    def row_count(self):
+        return self.count
+
+    def load_page(self, page_number):
+        first = page_number * self.PAGE_SIZE
+        if self.ids is None:
+            cursor = self.connection.execute(
+                'SELECT method, amount, bill_id, timestamp FROM transactions '
+                'WHERE id > ? AND id <= ? ORDER BY id', (first, first + self.PAGE_SIZE))
+            return [[method, str(amount), bill_id, timestamp] for method, amount, bill_id, timestamp in cursor]
+
+        page_ids = [int(row_id) for row_id in self.ids[first:first + self.PAGE_SIZE]]
+        placeholders = ','.join('?' * len(page_ids))
+        cursor = self.connection.execute(
+            f'SELECT id, method, amount, bill_id, timestamp FROM transactions WHERE id IN ({placeholders})', page_ids)
+        rows = {row_id: [method, str(amount), bill_id, timestamp] for row_id, method, amount, bill_id, timestamp in cursor}
+        return [rows[row_id] for row_id in page_ids]
+
+    def row(self, row_number):
+        page_number = row_number // self.PAGE_SIZE
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.load_page(page_number)
+            self.pages[page_number] = page
+            if len(self.pages) > self.max_cached_pages:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_number)
+        return page[row_number % self.PAGE_SIZE]
+
+    def close(self):
+        self.pages.clear()
+
+
+class SqliteLedgerReader:
+    # Read-only connection to the transactions database. WAL lets it read
+    # committed rows while a SqliteTransactionStore on another thread writes.
+    def __init__(self, db_path=DATABASE_PATH):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA query_only=ON')
+
+    @property
+    def path(self):
+        return self.db_path
+
+    @property
+    def closed(self):
+        return self.connection is None
+
+    def load_columns(self, start=None, end=None):
+        where, parameters = self.where_clause(start=start, end=end)
+        cursor = self.connection.execute(f'SELECT method, amount, timestamp FROM transactions{where}', parameters)
+        rows = cursor.fetchall()
+        if not rows:
+            return {'methods': [], 'method': np.zeros(0, dtype=np.int32),
+                    'amount': np.zeros(0), 'stamp': np.zeros(0, dtype=np.int64)}
+        methods, amounts, timestamps = zip(*rows)
+        names, codes = np.unique(np.array(methods, dtype=str), return_inverse=True)
+        stamp_bytes = np.frombuffer(''.join(timestamps).encode('ascii'), dtype=np.uint8).reshape(-1, 19)
+        return {
+            'methods': [str(name) for name in names],
+            'method': codes.astype(np.int32),
+            'amount': np.array(amounts, dtype=np.float64),
+            'stamp': stamps_from_bytes(stamp_bytes),
+        }
+
+    def where_clause(self, method=None, bill_id=None, start=None, end=None):
+        conditions, parameters = [], []
+        for condition, value in (('method = ?', method), ('bill_id = ?', bill_id),
+                                 ('timestamp >= ?', start), ('timestamp < ?', end)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+    def query(self, method=None, bill_id=None, start=None, end=None):
+        where, parameters = self.where_clause(method, bill_id, start, end)
+        cursor = self.connection.execute(
+            f'SELECT method, amount, bill_id, timestamp FROM transactions{where} ORDER BY id', parameters)
+        return [[method, str(amount), bill_id, timestamp] for method, amount, bill_id, timestamp in cursor]
+
+    def find_bill(self, bill_id):
+        # Latest row wins, as in find_bills and the CSV store
+        rows = self.query(bill_id=bill_id)
+        return rows[-1] if rows else None
+
+    def find_bills(self, bill_ids, chunk_size=500):
+        # Bill ID -> row through the bill_id index, a chunk of IDs per query
+        bill_ids, rows = list(bill_ids), {}
+        for first in range(0, len(bill_ids), chunk_size):
+            chunk = bill_ids[first:first + chunk_size]
+            cursor = self.connection.execute(
+                f'SELECT method, amount, bill_id, timestamp FROM transactions '
+                f'WHERE bill_id IN ({",".join("?" * len(chunk))}) ORDER BY id', chunk)
+            rows.update((bill_id, [method, str(amount), bill_id, timestamp])
+                        for method, amount, bill_id, timestamp in cursor)
+        return rows
+
+    def history(self, method=None, bill_id=None, start=None, end=None):
+        if method is None and bill_id is None and start is None and end is None:
+            return SqliteRowSource(self.connection)
+        where, parameters = self.where_clause(method, bill_id, start, end)
+        cursor = self.connection.execute(f'SELECT id FROM transactions{where} ORDER BY id', parameters)
+        return SqliteRowSource(self.connection, np.fromiter((row_id for row_id, in cursor), dtype=np.int64))
+
+    def close(self):
+        if not self.closed:
+            self.connection.close()
+            self.connection = None
+
+
+class SqliteTransactionStore(SqliteLedgerReader):
+    # Storage backend on an embedded SQLite database in WAL mode with indexes
+    # on Bill ID, timestamp and method, so lookups and filtered history views
+    # are index-driven. Inserts are group-committed like the CSV ledger.
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            method TEXT NOT NULL,
+            amount REAL NOT NULL,
+            bill_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS migrations (
+            source TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            migrated_at TEXT NOT NULL
+        );
+    '''
+    INDEXES = '''
+        CREATE INDEX IF NOT EXISTS transactions_bill_id ON transactions (bill_id);
+        CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+        CREATE INDEX IF NOT EXISTS transactions_method ON transactions (method, timestamp);
+    '''
+
+    def __init__(self, db_path=DATABASE_PATH, flush_interval=0.5, batch_size=64, synchronous='NORMAL',
+                 recent_size=100, create_indexes=True):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(f'PRAGMA synchronous={synchronous}')
+        self.connection.executescript(self.SCHEMA)
+        if create_indexes:
+            self.connection.executescript(self.INDEXES)
+
+        self.pending = []
+        self.last_commit = time.monotonic()
+
+        cursor = self.connection.execute(
+            'SELECT method, amount, bill_id, timestamp FROM transactions ORDER BY id DESC LIMIT ?', (recent_size,))
+        recent = [[method, str(amount), bill_id, timestamp] for method, amount, bill_id, timestamp in cursor]
+        self.recent = deque(reversed(recent), maxlen=recent_size)
+
+        atexit.register(self.close)
+
+    def position(self):
+        # Highest row id committed so far
+        self.flush()
+        return self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+
+    def rows_since(self, position):
+        end = self.position()
+        if not isinstance(position, int) or position > end:
+            return None, end
+        cursor = self.connection.execute(
+            'SELECT method, amount, bill_id, timestamp FROM transactions WHERE id > ? AND id <= ? ORDER BY id',
+            (position, end))
+        return [[method, str(amount), bill_id, timestamp] for method, amount, bill_id, timestamp in cursor], end
+
+    def append(self, row):
+        if self.closed:
+            raise ValueError('Transaction store is closed.')
+        self.pending.append(row)
+        self.recent.append([str(value) for value in row])
+        if len(self.pending) >= self.batch_size or self.flush_interval <= 0:
+            self.commit()
+        else:
+            self.flush_if_due()
+
+    def latest(self):
+        return list(self.recent[-1]) if self.recent else []
+
+    def tail(self, count):
+        if count <= len(self.recent):
+            return [list(row) for row in list(self.recent)[len(self.recent) - count:]]
+        self.flush()
+        cursor = self.connection.execute(
+            'SELECT method, amount, bill_id, timestamp FROM transactions ORDER BY id DESC LIMIT ?', (count,))
+        return [[method, str(amount), bill_id, timestamp] for method, amount, bill_id, timestamp in cursor][::-1]
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.last_commit >= self.flush_interval:
+            self.commit()
+
+    def flush(self):
+        if not self.closed:
+            self.commit()
+
+    def commit(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT INTO transactions (method, amount, bill_id, timestamp) VALUES (?, ?, ?, ?)',
+                    self.pending)
+            self.pending = []
+        self.last_commit = time.monotonic()
+
+    def open_reader(self):
+        # A separate read-only connection for another thread
+        return SqliteLedgerReader(self.db_path)
+
+    def load_columns(self, start=None, end=None):
+        self.flush()
+        return super().load_columns(start, end)
+
+    def query(self, method=None, bill_id=None, start=None, end=None):
+        self.flush()
+        return super().query(method, bill_id, start, end)
+
+    def find_bills(self, bill_ids, chunk_size=500):
+        self.flush()
+        return super().find_bills(bill_ids, chunk_size)
+
+    def history(self, method=None, bill_id=None, start=None, end=None):
+        self.flush()
+        return super().history(method, bill_id, start, end)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.commit()
+        finally:
+            self.connection.close()
+            self.connection = None
+            atexit.unregister(self.close)
+
+
+def migrate_csv_to_sqlite(csv_paths, db_path=DATABASE_PATH, batch_size=50000):
+    # One-shot bulk load of existing CSV ledgers into the SQLite store. Each
+    # file is recorded in the migrations table so running it twice is a no-op.
+    # Indexes are built after the load, which is much faster than maintaining
+    # them row by row.
+    store = SqliteTransactionStore(db_path, create_indexes=False)
+    connection = store.connection
+    migrated = 0
+    try:
+        for csv_path in csv_paths:
+            source = os.path.abspath(csv_path)
+            if connection.execute('SELECT 1 FROM migrations WHERE source = ?', (source,)).fetchone():
+                print(f'{csv_path} was already migrated, skipping.')
+                continue
+
+            rows_in_file = 0
+            with open(csv_path, 'r', newline='') as csvfile, connection:
+                csv_reader = csv.reader(csvfile)
+                batch = []
+                for row in csv_reader:
+                    if not row or row == LEDGER_HEADER:
+                        continue
+                    batch.append(row[:4])
+                    if len(batch) >= batch_size:
+                        connection.executemany(
+                            'INSERT INTO transactions (method, amount, bill_id, timestamp) VALUES (?, ?, ?, ?)', batch)
+                        rows_in_file += len(batch)
+                        batch = []
+                if batch:
+                    connection.executemany(
+                        'INSERT INTO transactions (method, amount, bill_id, timestamp) VALUES (?, ?, ?, ?)', batch)
+                    rows_in_file += len(batch)
+                connection.execute('INSERT INTO migrations (source, rows, migrated_at) VALUES (?, ?, ?)',
+                                   (source, rows_in_file, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            print(f'Migrated {rows_in_file} rows from {csv_path}.')
+            migrated += rows_in_file
+
+        connection.executescript(SqliteTransactionStore.INDEXES)
+        connection.execute('ANALYZE')
+    finally:
+        store.close()
+    return migrated
+
+
+class BillIdAllocator:
+    # Hands out unique, increasing bill IDs without looking at the ledger.
+    # A shared counter file next to the ledger is advanced a block at a time
+    # under an exclusive lock and fsynced before any ID of the block is used,
+    # so terminals (and the ledger server) never hand out the same ID and a
+    # crash can only leave a gap. IDs start at seven digits, above the old
+    # random six-digit ones.
+    FIRST_ID = 1000000
+    WIDTH = 20  # Fixed-width counter, so it is always rewritten in place
+
+    def __init__(self, state_path, block_size=1000):
+        self.state_path = state_path
+        self.block_size = max(1, block_size)
+        self.next_id = self.block_end = 0
+        self.lock = threading.Lock()
+
+    def reserve_block(self):
+        descriptor = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            stored = os.pread(descriptor, self.WIDTH, 0).strip()
+            start = max(int(stored) if stored.isdigit() else 0, self.FIRST_ID)
+            os.pwrite(descriptor, f'{start + self.block_size:<{self.WIDTH - 1}}\n'.encode('ascii'), 0)
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)  # Also releases the lock
+        self.next_id, self.block_end = start, start + self.block_size
+
+    def allocate(self):
+        with self.lock:
+            if self.next_id >= self.block_end:
+                self.reserve_block()
+            bill_id = self.next_id
+            self.next_id += 1
+            return str(bill_id)
+
+
+def encode_columns(columns):
+    # Columnar loads cross the ledger socket as base64 of the raw arrays
+    return {'methods': columns['methods'],
+            'method': base64.b64encode(np.ascontiguousarray(columns['method'], dtype='<i4')).decode('ascii'),
+            'amount': base64.b64encode(np.ascontiguousarray(columns['amount'], dtype='<f8')).decode('ascii'),
+            'stamp': base64.b64encode(np.ascontiguousarray(columns['stamp'], dtype='<i8')).decode('ascii')}
+
+
+def decode_columns(message):
+    return {'methods': message['methods'],
+            'method': np.frombuffer(base64.b64decode(message['method']), dtype='<i4').astype(np.int32),
+            'amount': np.frombuffer(base64.b64decode(message['amount']), dtype='<f8').copy(),
+            'stamp': np.frombuffer(base64.b64decode(message['stamp']), dtype='<i8').copy()}
+
+
+class LedgerRequestHandler(socketserver.StreamRequestHandler):
+    # One per client connection. Requests are newline-delimited JSON and may
+    # be pipelined. Writes are queued for the server's writer thread and reads
+    # for its reader thread; each gets a reply slot, and a sender thread
+    # writes the replies back in request order.
+    wbufsize = 65536
+
+    def handle(self):
+        replies = queue.Queue()
+        sender = threading.Thread(target=self.send_replies, args=(replies,), daemon=True)
+        sender.start()
+        connection = next(self.server.connection_ids)
+        last_write = None
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                request = {'error': 'Malformed request.'}
+            slot = Future()
+            replies.put(slot)
+            if request.get('op') in LedgerServer.WRITE_OPS:
+                self.server.requests.put((request, slot))
+                last_write = slot
+            else:
+                # A read waits for this client's earlier writes to be committed
+                self.server.reads.put((request, slot, last_write, connection))
+        # Release the history views this connection still holds
+        self.server.reads.put((None, None, None, connection))
+        replies.put(None)
+        sender.join()
+
+    def send_replies(self, replies):
+        connected = True
+        while True:
+            slot = replies.get()
+            if slot is None:
+                break
+            if connected and not slot.done():
+                try:
+                    self.wfile.flush()  # Don't hold earlier replies back while this one is pending
+                except OSError:
+                    connected = False
+            reply = slot.result()
+            if not connected:
+                continue
+            try:
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+                if replies.empty():
+                    self.wfile.flush()
+            except OSError:
+                connected = False  # Client went away; keep draining
+
+
+class LedgerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Single-writer ledger service. Any number of terminals connect over a
+    # Unix socket, and one writer thread owns the store: it takes whatever
+    # writes have queued up, appends them all, commits once (one fsync for
+    # the batch) and only then replies, so every acknowledged bill ID is
+    # durable and rows from different terminals can never interleave. Reads
+    # run on a separate reader thread with its own view of the committed
+    # ledger, so a long query or history page never holds up a commit. Each
+    # connection has its own history views, so terminals can't evict each
+    # other's.
+    daemon_threads = True
+    MAX_SOURCES = 16
+    WRITE_OPS = {'append', 'latest', 'tail', 'position', 'rows_since'}
+
+    def __init__(self, socket_path, store_factory, max_batch=4096):
+        self.socket_path = socket_path
+        self.store_factory = store_factory
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.reads = queue.Queue()
+        self.sources = {}  # connection -> OrderedDict of id -> row source of an open history view
+        self.connection_ids = itertools.count(1)
+        self.next_source = 0
+        self.store = None
+        self.reader = None
+        self.ready = threading.Event()
+        self.reader_ready = threading.Event()
+        self.startup_error = None
+
+        if os.path.exists(socket_path):
+            # Remove a stale socket, but never steal one that a live server owns
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise OSError(f'A ledger server is already listening on {socket_path}')
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)
+            finally:
+                probe.close()
+        super().__init__(socket_path, LedgerRequestHandler)
+
+        # The store is opened on the writer thread, which is the only thread
+        # that ever touches it, and the reader on the reader thread (SQLite
+        # connections are bound to their thread)
+        self.writer_thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.reader_thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.writer_thread.start()
+        self.ready.wait()
+        if self.startup_error is None:
+            self.reader_thread.start()
+            self.reader_ready.wait()
+            if self.startup_error is not None:
+                self.requests.put((None, None))
+                self.writer_thread.join()
+        if self.startup_error is not None:
+            self.server_close()
+            raise self.startup_error
+
+    def write_loop(self):
+        try:
+            self.store = self.store_factory()
+            self.bill_ids = BillIdAllocator(os.path.abspath(self.store.path) + '.billid')
+        except Exception as error:
+            self.startup_error = error
+            return
+        finally:
+            self.ready.set()
+        try:
+            while True:
+                batch = [self.requests.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self.requests.get_nowait())
+                    except queue.Empty:
+                        break
+                if not self.process_batch(batch):
+                    break
+        finally:
+            self.store.close()
+
+    def read_loop(self):
+        try:
+            self.reader = self.store.open_reader()
+        except Exception as error:
+            self.startup_error = error
+            return
+        finally:
+            self.reader_ready.set()
+        try:
+            while True:
+                request, slot, after, connection = self.reads.get()
+                if request is None:
+                    if connection is None:
+                        break  # Shutdown marker
+                    for source in self.sources.pop(connection, {}).values():
+                        source.close()
+                    continue
+                if after is not None:
+                    after.result()
+                try:
+                    reply = self.handle_read(request, self.sources.setdefault(connection, OrderedDict()))
+                except (KeyError, TypeError, ValueError, IndexError, OSError) as error:
+                    reply = {'error': str(error) or error.__class__.__name__}
+                slot.set_result(reply)
+        finally:
+            for sources in self.sources.values():
+                for source in sources.values():
+                    source.close()
+            self.reader.close()
+
+    def process_batch(self, batch):
+        replies_due = []  # (slot, reply, is_append), held until the commit
+        running = True
+        for request, slot in batch:
+            if slot is None:
+                running = False  # Shutdown marker
+                continue
+            try:
+                reply = self.handle_request(request)
+            except (KeyError, TypeError, ValueError, IndexError, OSError) as error:
+                reply = {'error': str(error) or error.__class__.__name__}
+            replies_due.append((slot, reply, request.get('op') == 'append' and 'error' not in reply))
+        try:
+            self.store.flush()
+        except OSError as error:
+            replies_due = [(slot, {'error': f'Commit failed: {error}'} if is_append else reply, is_append)
+                           for slot, reply, is_append in replies_due]
+        for slot, reply, _ in replies_due:
+            slot.set_result(reply)
+        return running
+
+    def handle_request(self, request):
+        op = request.get('op')
+        if op == 'append':
+            return self.append(request['row'])
+        if op == 'latest':
+            return {'row': self.store.latest()}
+        if op == 'tail':
+            return {'rows': self.store.tail(int(request['count']))}
+        if op == 'position':
+            return {'position': self.store.position()}
+        if op == 'rows_since':
+            rows, end = self.store.rows_since(request.get('position'))
+            return {'rows': rows, 'position': end}
+        raise ValueError(f'Unknown operation: {op}')
+
+    def handle_read(self, request, sources):
+        if 'error' in request:
+            return {'error': request['error']}
+        op = request.get('op')
+        filters = {name: request.get(name) for name in ('method', 'bill_id', 'start', 'end')}
+        if op == 'columns':
+            return encode_columns(self.reader.load_columns(request.get('start'), request.get('end')))
+        if op == 'query':
+            return {'rows': self.reader.query(**filters)}
+        if op == 'find_bill':
+            return {'row': self.reader.find_bill(request['bill_id'])}
+        if op == 'find_bills':
+            return {'rows': self.reader.find_bills(request['bill_ids'])}
+        if op == 'history':
+            source = self.reader.history(**filters)
+            self.next_source += 1
+            sources[self.next_source] = source
+            while len(sources) > self.MAX_SOURCES:
+                sources.popitem(last=False)[1].close()
+            return {'source': self.next_source, 'rows': source.row_count()}
+        if op == 'rows':
+            source = sources[int(request['source'])]
+            sources.move_to_end(int(request['source']))
+            start = int(request['start'])
+            end = min(start + int(request['count']), source.row_count())
+            return {'rows': [source.row(row_number) for row_number in range(start, end)]}
+        if op == 'release':
+            source = sources.pop(int(request['source']), None)
+            if source is not None:
+                source.close()
+            return {}
+        if op == 'ping':
+            return {'path': os.path.abspath(self.reader.path)}
+        raise ValueError(f'Unknown operation: {op}')
+
+    def append(self, row):
+        # The row is committed with the rest of the batch in process_batch
+        method, amount, bill_id, timestamp = (list(row) + [None, None])[:4]
+        if method not in PAYMENT_METHODS:
+            raise ValueError(f'Unknown payment method: {method}')
+        float(amount)
+        bill_id = str(bill_id) if bill_id else self.bill_ids.allocate()
+        timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.store.append([method, amount, bill_id, timestamp])
+        return {'bill_id': bill_id, 'timestamp': timestamp}
+
+    def shutdown(self):
+        super().shutdown()
+        self.requests.put((None, None))
+        self.reads.put((None, None, None, None))
+        self.writer_thread.join()
+        self.reader_thread.join()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class RemoteRowSource:
+    # Row source over a history view held open by the ledger server, fetched
+    # a page at a time like the local sources
+    PAGE_SIZE = 256
+
+    def __init__(self, store, source_id, count, max_cached_pages=64):
+        self.store = store
+        self.source_id = source_id
+        self.count = count
+        self.pages = OrderedDict()
+        self.max_cached_pages = max_cached_pages
+
+    def row_count(self):
+        return self.count
+
+    def row(self, row_number):
+        page_number = row_number // self.PAGE_SIZE
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.store.call('rows', source=self.source_id, start=page_number * self.PAGE_SIZE,
+                                   count=self.PAGE_SIZE)['rows']
+            self.pages[page_number] = page
+            if len(self.pages) > self.max_cached_pages:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_number)
+        return page[row_number % self.PAGE_SIZE]
+
+    def close(self):
+        self.pages.clear()
+        if not self.store.closed:
+            self.store.call('release', source=self.source_id)
+
+
+class SocketTransactionStore:
+    # Storage backend that talks to a LedgerServer, so several terminals can
+    # share one ledger safely. Appends are pipelined: up to batch_size of them
+    # are in flight before their commits are awaited. With flush_interval 0
+    # (the dialog's default) each append waits for its commit.
+    shared = True  # Other terminals write to the same ledger
+
+    def __init__(self, socket_path=SOCKET_PATH, flush_interval=0.0, batch_size=64, recent_size=100, timeout=30.0):
+        self.socket_path = socket_path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.settimeout(timeout)
+        self.connection.connect(socket_path)
+        self.reader = self.connection.makefile('rb')
+        self.writer = self.connection.makefile('wb')
+        self.in_flight = deque()  # Rows sent but not acknowledged yet
+        self.recent = deque(maxlen=recent_size)
+        self.last_flush = time.monotonic()
+        atexit.register(self.close)
+        # The server's ledger, so checkpoints and bill ID state sit beside it
+        self.ledger_path = self.call('ping')['path']
+
+    @property
+    def path(self):
+        return self.ledger_path
+
+    @property
+    def closed(self):
+        return self.connection is None
+
+    def send(self, request):
+        if self.closed:
+            raise ValueError('Transaction store is closed.')
+        self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+
+    def receive(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('The ledger server closed the connection.')
+        return json.loads(line)
+
+    def call(self, op, **params):
+        self.send(dict(params, op=op))
+        self.flush()
+        reply = self.receive()
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply
+
+    def append(self, row):
+        self.send({'op': 'append', 'row': row})
+        row = list(row)
+        self.in_flight.append(row)
+        self.recent.append(row)
+        if len(self.in_flight) >= self.batch_size or self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        # Wait for the commit of every append in flight; the server's bill ID
+        # and timestamp are what ended up in the ledger
+        self.writer.flush()
+        errors = []
+        while self.in_flight:
+            row = self.in_flight.popleft()
+            reply = self.receive()
+            if 'error' in reply:
+                errors.append(reply['error'])
+            else:
+                row[2], row[3] = reply['bill_id'], reply['timestamp']
+        self.last_flush = time.monotonic()
+        if errors:
+            raise ValueError(f'{len(errors)} transaction(s) were rejected: {errors[0]}')
+
+    def flush_if_due(self):
+        if self.in_flight and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def latest(self):
+        # This terminal's latest row (not another terminal's)
+        if self.recent:
+            return [str(value) for value in self.recent[-1]]
+        return self.call('latest')['row']
+
+    def tail(self, count):
+        return self.call('tail', count=count)['rows']
+
+    def position(self):
+        return self.call('position')['position']
+
+    def rows_since(self, position):
+        reply = self.call('rows_since', position=position)
+        return reply['rows'], reply['position']
+
+    def load_columns(self, start=None, end=None):
+        return decode_columns(self.call('columns', start=start, end=end))
+
+    def query(self, method=None, bill_id=None, start=None, end=None):
+        return self.call('query', method=method, bill_id=bill_id, start=start, end=end)['rows']
+
+    def find_bill(self, bill_id):
+        return self.call('find_bill', bill_id=bill_id)['row']
+
+    def find_bills(self, bill_ids):
+        return self.call('find_bills', bill_ids=list(bill_ids))['rows']
+
+    def history(self, method=None, bill_id=None, start=None, end=None):
+        reply = self.call('history', method=method, bill_id=bill_id, start=start, end=end)
+        return RemoteRowSource(self, reply['source'], reply['rows'])
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            for stream in (self.reader, self.writer, self.connection):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+            self.connection = None
+            atexit.unregister(self.close)
+
+
+def serve_ledger(socket_path, store_factory):
+    server = LedgerServer(socket_path, store_factory)
+    print(f'Ledger server listening on {socket_path}', file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        threading.Thread(target=server.shutdown).start()
+    finally:
+        server.writer_thread.join()
+        server.reader_thread.join()
+        server.server_close()
+
+
+def open_store(kind='csv', path=None, **options):
+    if kind == 'csv':
+        return CsvTransactionStore(path or LEDGER_PATH, **options)
+    if kind == 'sqlite':
+        return SqliteTransactionStore(path or DATABASE_PATH, **options)
+    if kind == 'socket':
+        return SocketTransactionStore(path or SOCKET_PATH, **options)
+    raise ValueError(f'Unknown storage backend: {kind}')
+
+
+def stamp_from_text(timestamp):
+    # 'YYYY-MM-DD HH:MM:SS' -> YYYYMMDDHHMMSS as an integer, which orders
+    # the same way and is cheap to compare in bulk
+    return int(timestamp[0:4] + timestamp[5:7] + timestamp[8:10] +
+               timestamp[11:13] + timestamp[14:16] + timestamp[17:19])
+
+
+def stamps_from_bytes(stamp_bytes):
+    # Vectorised stamp_from_text over an (N, 19) uint8 array of timestamps
+    stamps = np.zeros(len(stamp_bytes), dtype=np.int64)
+    for column in (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18):
+        stamps = stamps * 10 + (stamp_bytes[:, column].astype(np.int64) - 48)
+    return stamps
+
+
+def parse_amounts(buf, first, last, max_width=24):
+    # Parse plain decimal numbers (e.g. '12.5') between first and last without
+    # building Python strings. Digits are accumulated into an integer mantissa
+    # and divided once, which rounds exactly like float(). Anything unusual
+    # (signs, exponents, very long values) falls back to float() per row.
+    lengths = last - first
+    width = int(min(lengths.max(initial=0), max_width))
+    mantissa = np.zeros(len(first), dtype=np.int64)
+    fraction_digits = np.zeros(len(first), dtype=np.int64)
+    seen_dot = np.zeros(len(first), dtype=bool)
+    bad = lengths > max_width
+    for column in range(width):
+        active = column < lengths
+        chars = buf[np.minimum(first + column, len(buf) - 1)]
+        is_digit = (chars >= 48) & (chars <= 57) & active
+        is_dot = (chars == 46) & active
+        bad |= (active & ~is_digit & ~is_dot) | (is_dot & seen_dot)
+        mantissa = np.where(is_digit, mantissa * 10 + (chars.astype(np.int64) - 48), mantissa)
+        fraction_digits += is_digit & seen_dot
+        seen_dot |= is_dot
+    bad |= fraction_digits > 15
+
+    amounts = mantissa / np.power(10.0, np.minimum(fraction_digits, 15))
+    for row in np.flatnonzero(bad):
+        try:
+            amounts[row] = float(bytes(buf[first[row]:last[row]]))
+        except ValueError:
+            amounts[row] = np.nan
+    return amounts
+
+
+def load_ledger_columns(file_path):
+    # Columnar load of a CSV ledger: finds line and field boundaries with
+    # vectorised byte scans over a memory map, so millions of rows load in a
+    # fraction of a second. Methods come back dictionary-encoded.
+    columns = {'methods': [], 'method': np.zeros(0, dtype=np.int32),
+               'amount': np.zeros(0), 'stamp': np.zeros(0, dtype=np.int64)}
+    if not os.path.isfile(file_path) or os.path.getsize(file_path) == 0:
+        return columns
+
+    with open(file_path, 'rb') as ledger_file, \
+            mmap.mmap(ledger_file.fileno(), 0, access=mmap.ACCESS_READ) as ledger_map:
+        buf = np.frombuffer(ledger_map, dtype=np.uint8)
+        newlines = np.flatnonzero(buf == ord('\n'))
+        starts = np.concatenate(([0], newlines[:-1] + 1))
+        ends = newlines - (buf[np.maximum(newlines - 1, 0)] == ord('\r'))
+        if len(starts) and bytes(buf[starts[0]:ends[0]]).decode('utf-8', errors='replace').split(',') == LEDGER_HEADER:
+            starts, ends = starts[1:], ends[1:]
+        # Skip blank or truncated lines (a row is at least 'M,1,1,' + timestamp)
+        keep = ends - starts >= 25
+        starts, ends = starts[keep], ends[keep]
+
+        commas = np.flatnonzero(buf == ord(','))
+        first_comma = np.searchsorted(commas, starts)
+        method_end = commas[first_comma]
+        amount_end = commas[first_comma + 1]
+
+        # Methods: key every distinct method by its length and first/last
+        # eight bytes, then decode one sample per key
+        method_length = method_end - starts
+        outside = np.arange(8) >= method_length[:, None]
+        head = buf[np.minimum(starts[:, None] + np.arange(8), len(buf) - 1)]
+        tail = buf[np.maximum(method_end[:, None] - np.arange(1, 9), 0)]
+        head[outside] = 0
+        tail[outside] = 0
+        keys = (head.view(np.uint64).ravel() * np.uint64(1000003) ^ tail.view(np.uint64).ravel() * np.uint64(7919) ^
+                method_length.astype(np.uint64))
+        unique_keys, sample_rows, codes = np.unique(keys, return_index=True, return_inverse=True)
+        methods = [bytes(buf[starts[row]:method_end[row]]).decode('utf-8', errors='replace') for row in sample_rows]
+
+        stamp_bytes = buf[(ends - 19)[:, None] + np.arange(19)]
+        columns = {
+            'methods': methods,
+            'method': codes.astype(np.int32).ravel(),
+            'amount': parse_amounts(buf, method_end + 1, amount_end),
+            'stamp': stamps_from_bytes(stamp_bytes),
+        }
+        del buf
+    return columns
+
+
+def columns_from_rows(rows):
+    # Columnar form of rows that are already parsed
+    methods = sorted({row[0] for row in rows})
+    method_codes = {method: code for code, method in enumerate(methods)}
+    return {
+        'methods': methods,
+        'method': np.array([method_codes[row[0]] for row in rows], dtype=np.int32),
+        'amount': np.array([float(row[1]) for row in rows], dtype=np.float64),
+        'stamp': np.array([stamp_from_text(row[3]) for row in rows], dtype=np.int64),
+    }
+
+
+def new_method_stats():
+    return {'count': 0, 'sum': 0.0, 'min': None, 'max': None, 'hourly': [0] * 24}
+
+
+def compute_aggregates(columns, start=None, end=None):
+    # Vectorised recompute of the per-method aggregates over a columnar load,
+    # optionally limited to start <= timestamp < end ('YYYY-MM-DD HH:MM:SS')
+    method, amount, stamp = columns['method'], columns['amount'], columns['stamp']
+    if start is not None or end is not None:
+        mask = np.ones(len(stamp), dtype=bool)
+        if start is not None:
+            mask &= stamp >= stamp_from_text(start)
+        if end is not None:
+            mask &= stamp < stamp_from_text(end)
+        method, amount, stamp = method[mask], amount[mask], stamp[mask]
+
+    method_count = len(columns['methods'])
+    counts = np.bincount(method, minlength=method_count)
+    sums = np.bincount(method, weights=amount, minlength=method_count)
+    minimums = np.full(method_count, np.inf)
+    maximums = np.full(method_count, -np.inf)
+    np.minimum.at(minimums, method, amount)
+    np.maximum.at(maximums, method, amount)
+    hours = (stamp // 10000) % 100
+    hourly = np.bincount(method * 24 + hours, minlength=method_count * 24).reshape(method_count, 24)
+
+    result = {}
+    for code, name in enumerate(columns['methods']):
+        if counts[code]:
+            result[name] = {'count': int(counts[code]), 'sum': float(sums[code]),
+                            'min': float(minimums[code]), 'max': float(maximums[code]),
+                            'hourly': hourly[code].tolist()}
+    return result
+
+
+class SalesAggregates:
+    # Running per-method count/sum/min/max and an hour-of-day histogram,
+    # updated as each row is saved. They are checkpointed to
+    # <store>.agg.json together with the store position they cover, so a
+    # restart only has to fold in the rows written after the checkpoint.
+    def __init__(self, checkpoint_path):
+        self.checkpoint_path = checkpoint_path
+        self.methods = {}
+        self.position = None
+        self.unsaved_rows = 0
+
+    def add(self, method, amount, timestamp):
+        amount = float(amount)
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods[method] = new_method_stats()
+        stats['count'] += 1
+        stats['sum'] += amount
+        stats['min'] = amount if stats['min'] is None else min(stats['min'], amount)
+        stats['max'] = amount if stats['max'] is None else max(stats['max'], amount)
+        stats['hourly'][int(timestamp[11:13])] += 1
+        self.unsaved_rows += 1
+
+    def catch_up(self, store):
+        self.position = None
+        if os.path.isfile(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'r') as checkpoint_file:
+                    checkpoint = json.load(checkpoint_file)
+                self.methods = checkpoint['methods']
+                self.position = checkpoint['position']
+            except (OSError, ValueError, KeyError):
+                self.methods, self.position = {}, None
+        self.refresh(store)
+        self.checkpoint(self.position)
+
+    def refresh(self, store):
+        # Fold in the rows committed since self.position. Stores shared with
+        # other terminals are kept current this way instead of through add().
+        rows, end = store.rows_since(self.position) if self.position is not None else (None, store.position())
+        if rows is None:
+            # No usable checkpoint: rebuild everything with the vectorised path
+            self.methods = compute_aggregates(store.load_columns())
+            rows = []
+        for row in rows:
+            try:
+                self.add(row[0], row[1], row[3])
+            except (ValueError, IndexError):
+                continue
+        self.position = end
+
+    def checkpoint(self, position):
+        temp_path = f'{self.checkpoint_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump({'position': position, 'methods': self.methods}, checkpoint_file)
+        os.replace(temp_path, self.checkpoint_path)
+        self.position = position
+        self.unsaved_rows = 0
+
+
+class LedgerTableModel(QAbstractTableModel):
+    # Read-only table model over any row source with row_count() and row(i);
+    # Qt only asks for the rows that are actually on screen
+    def __init__(self, source, parent=None):
+        super(LedgerTableModel, self).__init__(parent)
+        self.source = source
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.source.row_count()
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(LEDGER_HEADER)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row = self.source.row(index.row())
+        return row[index.column()] if index.column() < len(row) else None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return LEDGER_HEADER[section]
+        return str(section + 1)
+
+
+class Span:
+    __slots__ = ('metrics', 'stage', 'method', 'started')
+
+    def __init__(self, metrics, stage, method):
+        self.metrics = metrics
+        self.stage = stage
+        self.method = method
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, self.method, time.perf_counter_ns() - self.started)
+
+
+class LatencyMetrics:
+    # In-memory latency histograms per (stage, payment method). Each sample
+    # costs a perf_counter_ns pair and one bucket increment; buckets are
+    # powers of two in nanoseconds, so percentiles are upper bounds within 2x.
+    BUCKETS = 64
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (stage, method) -> [count, total_ns, max_ns, buckets]
+        self.started = time.time()
+
+    def span(self, stage, method=None):
+        return Span(self, stage, method)
+
+    def record(self, stage, method, elapsed_ns):
+        key = (stage, method or 'all')
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0, 0, 0, [0] * self.BUCKETS]
+            histogram[0] += 1
+            histogram[1] += elapsed_ns
+            if elapsed_ns > histogram[2]:
+                histogram[2] = elapsed_ns
+            histogram[3][min(elapsed_ns.bit_length(), self.BUCKETS - 1)] += 1
+
+    @staticmethod
+    def percentile(buckets, count, fraction):
+        target, seen = fraction * count, 0
+        for bucket, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= target:
+                return (1 << bucket) / 1000.0
+        return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: [value[0], value[1], value[2], list(value[3])]
+                          for key, value in self.histograms.items()}
+        stages = []
+        for (stage, method), (count, total_ns, max_ns, buckets) in sorted(histograms.items()):
+            stages.append({
+                'stage': stage, 'method': method, 'count': count,
+                'mean_us': total_ns / count / 1000.0, 'max_us': max_ns / 1000.0,
+                'p50_us': min(self.percentile(buckets, count, 0.50), max_ns / 1000.0),
+                'p90_us': min(self.percentile(buckets, count, 0.90), max_ns / 1000.0),
+                'p99_us': min(self.percentile(buckets, count, 0.99), max_ns / 1000.0),
+                # upper bound in microseconds -> samples
+                'buckets': {str((1 << bucket) / 1000.0): bucket_count
+                            for bucket, bucket_count in enumerate(buckets) if bucket_count},
+            })
+        return {'since': self.started, 'written': time.time(), 'stages': stages}
+
+    def report(self):
+        lines = [f"{'stage':14} {'method':14} {'count':>8} {'mean_us':>10} {'p50_us':>10} {'p99_us':>10} {'max_us':>10}"]
+        for entry in self.snapshot()['stages']:
+            lines.append(f"{entry['stage']:14} {entry['method']:14} {entry['count']:8d} {entry['mean_us']:10.1f} "
+                         f"{entry['p50_us']:10.1f} {entry['p99_us']:10.1f} {entry['max_us']:10.1f}")
+        return '\n'.join(lines)
+
+    def prometheus_text(self):
+        lines = ['# TYPE payment_stage_seconds histogram']
+        for entry in self.snapshot()['stages']:
+            labels = f'stage="{entry["stage"]}",method="{entry["method"]}"'
+            cumulative = 0
+            for upper_us, bucket_count in entry['buckets'].items():
+                cumulative += bucket_count
+                lines.append(f'payment_stage_seconds_bucket{{{labels},le="{float(upper_us) / 1e6:g}"}} {cumulative}')
+            lines.append(f'payment_stage_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f'payment_stage_seconds_sum{{{labels}}} {entry["mean_us"] * entry["count"] / 1e6:.9f}')
+            lines.append(f'payment_stage_seconds_count{{{labels}}} {entry["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self, file_path=METRICS_PATH):
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            json.dump(self.snapshot(), metrics_file, indent=2)
+        os.replace(temp_path, file_path)
+
+    def serve(self, port, host='127.0.0.1'):
+        # Local endpoint: /metrics (Prometheus text) and /metrics.json
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = metrics.prometheus_text().encode(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return server
+
+
+def qr_payload_hash(amount, bill_id):
+    return hashlib.sha256(f'Payment: Amount: {amount} BillID: {bill_id}'.encode()).hexdigest()
+
+
+class PaymentError(ValueError):
+    pass
+
+
+class PaymentProcessor:
+    # The payment engine without any UI: validates amounts, allocates bill
+    # IDs and records transactions. PaymentDialog drives one of these, and so
+    # does the bulk ingestion CLI, so both go through the same code path.
+    def __init__(self, store=None, export_path=EXPORT_PATH, export_options=None, metrics=None):
+        self.store = store if store is not None else CsvTransactionStore(LEDGER_PATH)
+        self.metrics = metrics if metrics is not None else LatencyMetrics()
+        self.export_path = export_path
+        # payment_history.csv gets the same open-handle, header-once writer
+        # (and rotation policy, if any) as the ledger itself
+        self.export = LedgerWriter(export_path, **dict({'fsync': 'never', 'recent_size': 1}, **(export_options or {})))
+        self.bill_ids = BillIdAllocator(self.store.path + '.billid')
+
+        # Running sales aggregates, restored from their checkpoint and
+        # brought up to date with any rows written after it
+        # Behind a ledger server other terminals add rows too, so the
+        # aggregates follow the store rather than this terminal's payments
+        self.shared = getattr(self.store, 'shared', False)
+        self.aggregates = SalesAggregates(self.store.path + '.agg.json')
+        self.aggregates.catch_up(self.store)
+        # After a rotation the checkpoint has to point into the new segment
+        if hasattr(self.store, 'rotate_listeners'):
+            self.store.rotate_listeners.append(
+                lambda: self.aggregates.checkpoint(self.store.position()))
+
+    def parse_amount(self, amount):
+        with self.metrics.span('validation'):
+            if not amount:
+                raise PaymentError('Please enter the payment amount.')
+            try:
+                return float(amount)
+            except ValueError:
+                raise PaymentError('Invalid amount. Please enter a numeric value.')
+
+    def pay(self, method, amount):
+        if method == 'Student Card':
+            return self.execute_student_card_payment(amount)
+        if method == 'Cash':
+            return self.execute_cash_payment(amount)
+        if method == 'QR Code':
+            return self.execute_qr_payment(amount)
+        raise PaymentError('Please select a payment method.')
+
+    def execute_student_card_payment(self, amount):
+        with self.metrics.span('payment', 'Student Card'):
+            if amount <= 0:
+                raise PaymentError('Invalid amount for student card payment.')
+            bill_id = self.generate_bill_id('Student Card')
+            self.save_transaction('Student Card', amount, bill_id)
+            return bill_id
+
+    def execute_cash_payment(self, amount):
+        with self.metrics.span('payment', 'Cash'):
+            if amount <= 0:
+                raise PaymentError('Invalid amount for cash payment.')
+            bill_id = self.generate_bill_id('Cash')
+            self.save_transaction('Cash', amount, bill_id)
+            return bill_id
+
+    def execute_qr_payment(self, amount, bill_id=None):
+        # bill_id is the one already embedded in the QR, if it was built first
+        with self.metrics.span('payment', 'QR Code'):
+            if amount <= 0:
+                raise PaymentError('Invalid amount for QR code payment.')
+            bill_id = bill_id or self.generate_bill_id('QR Code')
+            self.save_transaction('QR Code', amount, bill_id)
+            self.export_to_csv()  # Automatically export to CSV after each payment
+            return bill_id
+
+    def generate_qr_data(self, amount, bill_id):
+        # Generate QR code data with a secure hash
+        with self.metrics.span('qr_payload', 'QR Code'):
+            secure_hash = qr_payload_hash(amount, bill_id)
+            return f'Payment: Amount: {amount} BillID: {bill_id} Hash: {secure_hash}'
+
+    def generate_bill_id(self, method=None):
+        with self.metrics.span('bill_id', method):
+            return self.bill_ids.allocate()
+
+    def save_transaction(self, method, amount, bill_id):
+        with self.metrics.span('ledger_write', method):
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.store.append([method, amount, bill_id, timestamp])
+            if not self.shared:
+                self.aggregates.add(method, amount, timestamp)
+
+    def export_to_csv(self):
+        # Append the latest transaction; the header is only written once,
+        # when the file (or a new segment of it) is started
+        with self.metrics.span('export', 'QR Code'):
+            latest_transaction = self.get_latest_transaction()
+            if latest_transaction:
+                self.export.append(latest_transaction)
+
+    def get_latest_transaction(self):
+        # The ledger keeps the newest rows in memory, so this no longer
+        # depends on how many transactions the CSV file holds
+        return self.store.latest()
+
+    def refresh_aggregates(self):
+        if self.shared:
+            self.aggregates.refresh(self.store)
+
+    def checkpoint_aggregates(self):
+        self.refresh_aggregates()
+        if self.aggregates.unsaved_rows:
+            self.aggregates.checkpoint(self.store.position())
+
+    def flush_if_due(self):
+        self.store.flush_if_due()
+        self.export.flush_if_due()
+
+    def close(self):
+        self.checkpoint_aggregates()
+        self.store.close()
+        self.export.close()
+
+
+def parse_payment_batch(lines):
+    # Turn 'method,amount' lines into (method, amount) pairs. Runs in worker
+    # processes during bulk ingestion; returns the payments and the number of
+    # lines that could not be used.
+    payments, rejected = [], 0
+    for row in csv.reader(lines):
+        if not row or row[0] == 'Method':
+            continue
+        try:
+            method, amount = row[0].strip(), float(row[1])
+        except (IndexError, ValueError):
+            rejected += 1
+            continue
+        if method not in PAYMENT_METHODS or amount <= 0:
+            rejected += 1
+            continue
+        payments.append((method, amount))
+    return payments, rejected
+
+
+def read_batches(input_file, batch_size):
+    batch = []
+    for line in input_file:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_payments(processor, input_file, batch_size=1000, workers=1):
+    # Push every payment in input_file through the processor. Parsing and
+    # validation fan out over `workers` processes, with at most two batches
+    # per worker in flight so memory stays bounded. The payments themselves
+    # are recorded in input order by this process, the single writer.
+    started = time.perf_counter()
+    accepted = rejected = 0
+
+    def record(result):
+        nonlocal accepted, rejected
+        payments, bad_lines = result
+        rejected += bad_lines
+        for method, amount in payments:
+            processor.pay(method, amount)
+        accepted += len(payments)
+
+    batches = read_batches(input_file, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            record(parse_payment_batch(batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append(executor.submit(parse_payment_batch, batch))
+                if len(in_flight) >= workers * 2:
+                    record(in_flight.popleft().result())
+            while in_flight:
+                record(in_flight.popleft().result())
+
+    processor.store.flush()
+    elapsed = time.perf_counter() - started
+    return {'accepted': accepted, 'rejected': rejected, 'seconds': elapsed,
+            'per_second': accepted / elapsed if elapsed else 0.0}
+
+
+def check_qr_batch(lines):
+    # Parse scanned QR payloads and recompute their hashes. Runs in worker
+    # processes during verification; returns (payload, bill_id, amount,
+    # status) for every non-blank line.
+    results = []
+    for line in lines:
+        payload = line.strip()
+        if not payload:
+            continue
+        match = QR_PAYLOAD_PATTERN.fullmatch(payload)
+        if match is None:
+            results.append((payload, None, None, 'malformed'))
+            continue
+        amount, bill_id, secure_hash = match.groups()
+        status = 'ok' if secure_hash == qr_payload_hash(amount, bill_id) else 'hash_mismatch'
+        results.append((payload, bill_id, amount, status))
+    return results
+
+
+def verify_qr_payloads(store, input_file, batch_size=5000, workers=1):
+    # End-of-day reconciliation of scanned QR payloads. Hashes are checked
+    # across `workers` processes; every bill is then looked up in one batch
+    # through the store's Bill ID index (a dict built in one pass for CSV).
+    # Returns the status counts and (status, payload, ledger row) for every
+    # payload that is not 'ok'.
+    started = time.perf_counter()
+    results = []
+    batches = read_batches(input_file, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            results.extend(check_qr_batch(batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append(executor.submit(check_qr_batch, batch))
+                if len(in_flight) >= workers * 2:
+                    results.extend(in_flight.popleft().result())
+            while in_flight:
+                results.extend(in_flight.popleft().result())
+
+    ledger_rows = store.find_bills({bill_id for _, bill_id, _, status in results if status == 'ok'})
+    counts = {}
+    problems = []
+    seen = set()
+    for payload, bill_id, amount, status in results:
+        row = ledger_rows.get(bill_id) if status == 'ok' else None
+        if status == 'ok':
+            if row is None:
+                status = 'unknown_bill'
+            elif abs(float(row[1]) - float(amount)) > 0.005:
+                status = 'amount_mismatch'
+            elif row[0] != 'QR Code':
+                status = 'method_mismatch'
+            elif bill_id in seen:
+                status = 'duplicate'
+            seen.add(bill_id)
+        counts[status] = counts.get(status, 0) + 1
+        if status != 'ok':
+            problems.append((status, payload, row))
+    elapsed = time.perf_counter() - started
+    return {'checked': len(results), 'counts': counts, 'problems': problems, 'seconds': elapsed,
+            'per_second': len(results) / elapsed if elapsed else 0.0}
+
+
+def build_qr_image(data, box_size=6, border=4, metrics=None):
+    # Build the QR matrix and render it straight into a QImage. QImage (unlike
+    # QPixmap) may be created off the GUI thread, and going through raw pixels
+    # avoids the PNG encode/decode round trip.
+    span = metrics.span if metrics is not None else (lambda stage, method=None: nullcontext())
+    with span('qr_build', 'QR Code'):
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+
+    with span('qr_render', 'QR Code'):
+        img = qr.make_image(fill_color="black", back_color="white").convert('L')
+        image = QImage(img.tobytes(), img.width, img.height, img.width, QImage.Format_Grayscale8)
+        return image.copy()  # Detach from the Python buffer
+
+
+class QrSignals(QObject):
+    # request id, payload, rendered QImage
+    finished = Signal(int, str, object)
+
+
+def run_qr_job(request_id, payload, signals, metrics=None):
+    image = build_qr_image(payload, metrics=metrics)
+    signals.finished.emit(request_id, payload, image)
+
+
+class PaymentDialog(QDialog):
+    def __init__(self, parent=None, store=None, processor=None):
+        super(PaymentDialog, self).__init__(parent)
+
+        # All payment logic lives in the processor; the dialog only collects
+        # input and shows results. Any storage backend can sit behind it
+        # (CSV ledger by default, or SQLite).
+        self.processor = processor if processor is not None else PaymentProcessor(store)
+        self.store = self.processor.store
+
+        # Commit rows that are waiting for their group once the interval passes,
+        # even if no further payment arrives to trigger it
+        self.ledger_timer = QTimer(self)
+        self.ledger_timer.timeout.connect(self.processor.flush_if_due)
+        self.ledger_timer.start(max(50, int(self.store.flush_interval * 1000)))
+
+        # QR codes are built on a worker pool and handed back through a signal.
+        # While the cashier types, the QR for the current amount is built
+        # speculatively so it is usually ready when Pay is pressed.
+        self.qr_pool = QThreadPool(self)
+        self.qr_pool.setMaxThreadCount(2)
+        self.qr_signals = QrSignals(self)
+        self.qr_signals.finished.connect(self.on_qr_ready)
+        self.qr_request_id = 0
+        self.qr_display_id = None
+        self.qr_prefetched = OrderedDict()  # amount -> {'id', 'payload', 'image'}
+        self.qr_prefetch_limit = 8
+
+        self.qr_prefetch_timer = QTimer(self)
+        self.qr_prefetch_timer.setSingleShot(True)
+        self.qr_prefetch_timer.setInterval(150)
+        self.qr_prefetch_timer.timeout.connect(self.prefetch_qr)
+
+        self.aggregates = self.processor.aggregates
+        self.aggregates_timer = QTimer(self)
+        self.aggregates_timer.timeout.connect(self.processor.checkpoint_aggregates)
+        self.aggregates_timer.start(30000)
+
+        self.metrics_path = METRICS_PATH
+        self.dump_metrics_shortcut = QShortcut(QKeySequence('Ctrl+M'), self)
+        self.dump_metrics_shortcut.activated.connect(self.dump_metrics)
+
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Payment Options')
+
+        self.layout = QVBoxLayout()
+
+        self.label = QLabel('Choose Payment Method:')
+        self.layout.addWidget(self.label)
+
+        self.student_card_radio = QRadioButton('Student Card')
+        self.cash_radio = QRadioButton('Cash')
+        self.qr_radio = QRadioButton('QR Code')
+
+        self.layout.addWidget(self.student_card_radio)
+        self.layout.addWidget(self.cash_radio)
+        self.layout.addWidget(self.qr_radio)
+
+        self.amount_label = QLabel('Enter Amount:')
+        self.layout.addWidget(self.amount_label)
+
+        self.amount_input = QLineEdit(self)
+        self.amount_input.textChanged.connect(self.schedule_qr_prefetch)
+        self.qr_radio.toggled.connect(self.schedule_qr_prefetch)
+        self.layout.addWidget(self.amount_input)
+
+        self.pay_button = QPushButton('Pay')
+        self.pay_button.clicked.connect(self.process_payment)
+        self.layout.addWidget(self.pay_button)
+
+        # QLabel to display the QR code image
+        self.qr_label = QLabel(self)
+        self.layout.addWidget(self.qr_label)
+
+        # Button to show payment history
+        self.show_history_button = QPushButton('Show History')
+        self.show_history_button.clicked.connect(self.show_payment_history)
+        self.layout.addWidget(self.show_history_button)
+
+        # Button to show the sales summary
+        self.show_summary_button = QPushButton('Show Summary')
+        self.show_summary_button.clicked.connect(self.show_sales_summary)
+        self.layout.addWidget(self.show_summary_button)
+
+        self.setLayout(self.layout)
+
+    def process_payment(self):
+        try:
+            amount = self.processor.parse_amount(self.amount_input.text())
+        except PaymentError as e:
+            self.show_error_message(str(e))
+            return
+
+        if self.student_card_radio.isChecked():
+            self.execute_student_card_payment(amount)
+        elif self.cash_radio.isChecked():
+            self.execute_cash_payment(amount)
+        elif self.qr_radio.isChecked():
+            self.execute_qr_payment(amount)
+        else:
+            self.show_error_message('Please select a payment method.')
+
+    def execute_student_card_payment(self, amount):
+        try:
+            bill_id = self.processor.execute_student_card_payment(amount)
+        except PaymentError as e:
+            self.show_error_message(str(e))
+            return
+        print(f'Student Card Payment of {amount} with Bill ID {bill_id} executed successfully.')
+
+    def execute_cash_payment(self, amount):
+        try:
+            bill_id = self.processor.execute_cash_payment(amount)
+        except PaymentError as e:
+            self.show_error_message(str(e))
+            return
+        print(f'Cash Payment of {amount} with Bill ID {bill_id} received.')
+
+    def execute_qr_payment(self, amount):
+        # Use the speculatively built QR if there is one for this amount, and
+        # record the payment under the bill ID that QR carries; either way the
+        # QR is shown from on_qr_ready/show_qr_image and the GUI thread never
+        # builds it
+        request = self.qr_prefetched.pop(amount, None)
+        try:
+            bill_id = self.processor.execute_qr_payment(amount, request['bill_id'] if request else None)
+        except PaymentError as e:
+            self.show_error_message(str(e))
+            return
+        request = request or self.request_qr(amount, bill_id)
+        if request['image'] is not None:
+            self.qr_display_id = None
+            self.show_qr_image(request['image'])
+        else:
+            self.qr_display_id = request['id']
+        print(f'QR Code Payment of {amount} with Bill ID {bill_id} processed successfully.')
+
+    def request_qr(self, amount, bill_id=None):
+        # A prefetched QR reserves its bill ID now; unused ones are just gaps
+        self.qr_request_id += 1
+        bill_id = bill_id or self.processor.generate_bill_id('QR Code')
+        request = {'id': self.qr_request_id, 'bill_id': bill_id, 'image': None,
+                   'payload': self.processor.generate_qr_data(amount, bill_id)}
+        self.qr_pool.start(partial(run_qr_job, request['id'], request['payload'], self.qr_signals,
+                                   self.processor.metrics))
+        return request
+
+    def schedule_qr_prefetch(self, *args):
+        # Restart the debounce timer on every keystroke
+        self.qr_prefetch_timer.start()
+
+    def prefetch_qr(self):
+        if not self.qr_radio.isChecked():
+            return
+        try:
+            amount = float(self.amount_input.text())
+        except ValueError:
+            return
+        if amount <= 0 or amount in self.qr_prefetched:
+            return
+
+        self.qr_prefetched[amount] = self.request_qr(amount)
+        while len(self.qr_prefetched) > self.qr_prefetch_limit:
+            self.qr_prefetched.popitem(last=False)
+
+    def on_qr_ready(self, request_id, payload, image):
+        for request in self.qr_prefetched.values():
+            if request['id'] == request_id:
+                request['image'] = image
+                break
+        if request_id == self.qr_display_id:
+            self.qr_display_id = None
+            self.show_qr_image(image)
+
+    def show_qr_image(self, image):
+        with self.processor.metrics.span('pixmap_load', 'QR Code'):
+            self.qr_label.setPixmap(QPixmap.fromImage(image))
+        self.qr_label.setScaledContents(True)
+
+    def dump_metrics(self):
+        # On demand (Ctrl+M): write the metrics file and print the table
+        self.processor.metrics.write_file(self.metrics_path)
+        print(self.processor.metrics.report())
+
+    def save_transaction(self, method, amount, bill_id):
+        self.processor.save_transaction(method, amount, bill_id)
+
+    def done(self, result):
+        # Flush the last group of payments before the dialog goes away
+        self.ledger_timer.stop()
+        self.qr_prefetch_timer.stop()
+        self.aggregates_timer.stop()
+        self.qr_pool.waitForDone()
+        self.processor.close()
+        super(PaymentDialog, self).done(result)
+
+    def show_error_message(self, message):
+        msg_box = QMessageBox()
+        msg_box.setIcon(QMessageBox.Warning)
+        msg_box.setWindowTitle('Error')
+        msg_box.setText(message)
+        msg_box.exec_()
+
+    def show_payment_history(self):
+        # Show the history dialog
+        self.build_history_dialog().exec_()
+
+    def build_history_dialog(self):
+        # Create a new dialog to display payment history
+        history_dialog = QDialog(self)
+        history_dialog.setWindowTitle('Payment History')
+        history_dialog.setAttribute(Qt.WA_DeleteOnClose)
+
+        # Filters: method, exact Bill ID and day (YYYY-MM-DD)
+        method_filter = QComboBox()
+        method_filter.addItems(['All Methods'] + PAYMENT_METHODS)
+        bill_filter = QLineEdit()
+        bill_filter.setPlaceholderText('Bill ID')
+        date_filter = QLineEdit()
+        date_filter.setPlaceholderText('YYYY-MM-DD')
+        filter_button = QPushButton('Filter')
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(method_filter)
+        filter_layout.addWidget(bill_filter)
+        filter_layout.addWidget(date_filter)
+        filter_layout.addWidget(filter_button)
+
+        # Rows are only read when they scroll into view
+        table_view = QTableView()
+
+        def show_rows(source):
+            # History views hold files, maps or a server-side view open, so
+            # the one being replaced is closed
+            old_model = table_view.model()
+            table_view.setModel(LedgerTableModel(source, table_view) if source is not None else None)
+            if old_model is not None:
+                old_model.source.close()
+                old_model.deleteLater()
+
+        show_rows(self.store.history())
+        history_dialog.finished.connect(lambda result: show_rows(None))
+        # Fixed row heights keep Qt from measuring every row up front
+        table_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+
+        def apply_filter():
+            method = method_filter.currentText() if method_filter.currentIndex() > 0 else None
+            bill_id = bill_filter.text().strip() or None
+            day = date_filter.text().strip()
+            start = end = None
+            if day:
+                try:
+                    start_date = datetime.strptime(day, '%Y-%m-%d')
+                except ValueError:
+                    self.show_error_message('Invalid date. Please use YYYY-MM-DD.')
+                    return
+                start = start_date.strftime('%Y-%m-%d %H:%M:%S')
+                end = (start_date + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+            show_rows(self.store.history(method, bill_id, start, end))
+
+        filter_button.clicked.connect(apply_filter)
+
+        # Create a layout for the history dialog
+        history_layout = QVBoxLayout()
+        history_layout.addLayout(filter_layout)
+        history_layout.addWidget(table_view)
+
+        # Set the layout for the history dialog
+        history_dialog.setLayout(history_layout)
+        return history_dialog
+
+    def show_sales_summary(self):
+        summary_dialog = QDialog(self)
+        summary_dialog.setWindowTitle('Sales Summary')
+
+        summary_table = QTableWidget()
+        hourly_table = QTableWidget()
+
+        def fill_tables(aggregates):
+            methods = sorted(aggregates)
+            summary_table.clear()
+            summary_table.setRowCount(len(methods))
+            summary_table.setColumnCount(6)
+            summary_table.setHorizontalHeaderLabels(['Method', 'Count', 'Total', 'Min', 'Max', 'Average'])
+            hourly_table.clear()
+            hourly_table.setRowCount(len(methods))
+            hourly_table.setColumnCount(24)
+            hourly_table.setHorizontalHeaderLabels([f'{hour:02d}' for hour in range(24)])
+            hourly_table.setVerticalHeaderLabels(methods)
+            for row, method in enumerate(methods):
+                stats = aggregates[method]
+                values = [method, str(stats['count']), f"{stats['sum']:.2f}", f"{stats['min']:.2f}",
+                          f"{stats['max']:.2f}", f"{stats['sum'] / stats['count']:.2f}"]
+                for col, value in enumerate(values):
+                    summary_table.setItem(row, col, QTableWidgetItem(value))
+                for hour, count in enumerate(stats['hourly']):
+                    hourly_table.setItem(row, hour, QTableWidgetItem(str(count)))
+
+        # Ad-hoc ranges are recomputed from a columnar load of the store
+        start_input = QLineEdit()
+        start_input.setPlaceholderText('From YYYY-MM-DD')
+        end_input = QLineEdit()
+        end_input.setPlaceholderText('To YYYY-MM-DD (inclusive)')
+        range_button = QPushButton('Recompute Range')
+        all_time_button = QPushButton('All Time')
+
+        def recompute_range():
+            try:
+                start = end = None
+                if start_input.text().strip():
+                    start = datetime.strptime(start_input.text().strip(), '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+                if end_input.text().strip():
+                    end_date = datetime.strptime(end_input.text().strip(), '%Y-%m-%d') + timedelta(days=1)
+                    end = end_date.strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                self.show_error_message('Invalid date. Please use YYYY-MM-DD.')
+                return
+            fill_tables(compute_aggregates(self.store.load_columns(start, end), start, end))
+
+        range_button.clicked.connect(recompute_range)
+        all_time_button.clicked.connect(lambda: fill_tables(self.aggregates.methods))
+
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(start_input)
+        range_layout.addWidget(end_input)
+        range_layout.addWidget(range_button)
+        range_layout.addWidget(all_time_button)
+
+        # The running aggregates are already in memory, so this is instant
+        self.processor.refresh_aggregates()
+        fill_tables(self.aggregates.methods)
+
+        summary_layout = QVBoxLayout()
+        summary_layout.addLayout(range_layout)
+        summary_layout.addWidget(summary_table)
+        summary_layout.addWidget(QLabel('Payments per hour of day:'))
+        summary_layout.addWidget(hourly_table)
+        summary_dialog.setLayout(summary_layout)
+
+        summary_dialog.exec_()
+
+    def export_to_csv(self):
+        self.processor.export_to_csv()
+
+    def get_latest_transaction(self):
+        return self.processor.get_latest_transaction()
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Payment terminal')
+    parser.add_argument('--store', choices=['csv', 'sqlite', 'socket'], default='csv',
+                        help='storage backend for transactions; socket writes through a ledger server (default: csv)')
+    parser.add_argument('--db', default=DATABASE_PATH, help='SQLite database path')
+    parser.add_argument('--socket', default=SOCKET_PATH,
+                        help=f'Unix socket of the ledger server (default: {SOCKET_PATH})')
+    parser.add_argument('--migrate', nargs='+', metavar='CSV',
+                        help='bulk-load these CSV ledgers into the SQLite database and exit')
+    parser.add_argument('--rotate-size', type=int, metavar='BYTES',
+                        help='rotate the CSV ledger and payment history once they reach this size')
+    parser.add_argument('--rotate-daily', action='store_true',
+                        help='rotate the CSV ledger and payment history when the day changes')
+    parser.add_argument('--metrics-file', default=METRICS_PATH,
+                        help=f'where latency metrics are written (default: {METRICS_PATH})')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help='seconds between metrics file writes in the UI, 0 to disable (default: 10)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve /metrics and /metrics.json on this localhost port')
+    subparsers = parser.add_subparsers(dest='command')
+
+    verify_parser = subparsers.add_parser('verify', help='check scanned QR payloads against the ledger')
+    verify_parser.add_argument('input', nargs='?', default='-',
+                               help='file of QR payloads, one per line, or - for stdin (default)')
+    verify_parser.add_argument('--batch-size', type=int, default=5000,
+                               help='payloads per batch handed to a worker (default: 5000)')
+    verify_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                               help='processes used to recompute the hashes (default: one per CPU)')
+    verify_parser.add_argument('--output', help='write the problem report (CSV) here instead of stdout')
+
+    serve_parser = subparsers.add_parser('serve', help='run the single-writer ledger server on --socket')
+    serve_parser.add_argument('--socket', default=argparse.SUPPRESS, help='same as the global --socket')
+    serve_parser.add_argument('--fsync', choices=LedgerWriter.FSYNC_POLICIES, default='always',
+                              help='fsync policy for the CSV ledger (default: always)')
+
+    ingest_parser = subparsers.add_parser('ingest', help='bulk-ingest payments without the UI')
+    ingest_parser.add_argument('input', nargs='?', default='-',
+                               help="CSV file of 'method,amount' lines, or - for stdin (default)")
+    ingest_parser.add_argument('--batch-size', type=int, default=1000,
+                               help='payments per batch and per group commit (default: 1000)')
+    ingest_parser.add_argument('--workers', type=int, default=1,
+                               help='processes used to parse and validate input (default: 1)')
+    ingest_parser.add_argument('--fsync', choices=LedgerWriter.FSYNC_POLICIES, default='always',
+                               help='fsync policy for the CSV ledger (default: always)')
+    return parser.parse_args(argv)
+
+
+def rotation_options(args):
+    return {'rotate_bytes': args.rotate_size, 'rotate_daily': args.rotate_daily}
+
+
+def store_path(args):
+    return {'csv': None, 'sqlite': args.db, 'socket': args.socket}[args.store]
+
+
+def run_server(args):
+    # The server owns the real store; it commits whatever has queued up, so
+    # its own group-commit thresholds are never reached
+    if args.store == 'socket':
+        sys.exit('The ledger server needs --store csv or --store sqlite.')
+    options = {'batch_size': 1 << 30, 'flush_interval': 3600.0}
+    if args.store == 'csv':
+        options.update(rotation_options(args), fsync=args.fsync)
+    serve_ledger(args.socket, partial(open_store, args.store, store_path(args), **options))
+
+
+def run_ingest(args):
+    options = {'batch_size': args.batch_size, 'flush_interval': 60.0}
+    if args.store == 'csv':
+        options.update(rotation_options(args), fsync=args.fsync)
+    store = open_store(args.store, store_path(args), **options)
+    processor = PaymentProcessor(store, export_options=dict(rotation_options(args), batch_size=args.batch_size,
+                                                            flush_interval=60.0))
+    if args.metrics_port:
+        processor.metrics.serve(args.metrics_port)
+    try:
+        if args.input == '-':
+            result = ingest_payments(processor, sys.stdin, args.batch_size, args.workers)
+        else:
+            with open(args.input, 'r', newline='') as input_file:
+                result = ingest_payments(processor, input_file, args.batch_size, args.workers)
+    finally:
+        processor.close()
+    print(f"Ingested {result['accepted']} payments ({result['rejected']} rejected) in "
+          f"{result['seconds']:.2f}s: {result['per_second']:.0f} payments/s")
+    processor.metrics.write_file(args.metrics_file)
+    print(processor.metrics.report())
+
+
+def run_verify(args):
+    store = open_store(args.store, store_path(args))
+    try:
+        if args.input == '-':
+            result = verify_qr_payloads(store, sys.stdin, args.batch_size, args.workers)
+        else:
+            with open(args.input, 'r') as input_file:
+                result = verify_qr_payloads(store, input_file, args.batch_size, args.workers)
+    finally:
+        store.close()
+
+    output_file = open(args.output, 'w', newline='') if args.output else nullcontext(sys.stdout)
+    with output_file as report:
+        csv_writer = csv.writer(report)
+        csv_writer.writerow(['Status', 'Payload'] + [f'Ledger {name}' for name in LEDGER_HEADER])
+        for status, payload, row in result['problems']:
+            csv_writer.writerow([status, payload] + (row or []))
+    counts = ', '.join(f'{count} {status}' for status, count in sorted(result['counts'].items()))
+    print(f"Verified {result['checked']} QR payloads in {result['seconds']:.2f}s "
+          f"({result['per_second']:.0f}/s): {counts or 'nothing to check'}", file=sys.stderr)
+    return 1 if result['problems'] else 0
+
+
+if __name__ == '__main__':
+    args = parse_arguments(sys.argv[1:])
+    if args.migrate:
+        migrate_csv_to_sqlite(args.migrate, args.db)
+        sys.exit(0)
+    if args.command == 'ingest':
+        run_ingest(args)
+        sys.exit(0)
+    if args.command == 'verify':
+        sys.exit(run_verify(args))
+    if args.command == 'serve':
+        run_server(args)
+        sys.exit(0)
+
+    app = QApplication([])
+    if args.store == 'csv':
+        store = open_store('csv', **rotation_options(args))
+    else:
+        store = open_store(args.store, store_path(args))
+    dialog = PaymentDialog(processor=PaymentProcessor(store, export_options=rotation_options(args)))
+    dialog.metrics_path = args.metrics_file
+    metrics = dialog.processor.metrics
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.metrics_interval > 0:
+        metrics_timer = QTimer()
+        metrics_timer.timeout.connect(lambda: metrics.write_file(args.metrics_file))
+        metrics_timer.start(int(args.metrics_interval * 1000))
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> dumps the metrics; the timer gives Python a chance
+        # to run the handler while Qt's event loop is waiting
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dialog.dump_metrics())
+        signal_timer = QTimer()
+        signal_timer.timeout.connect(lambda: None)
+        signal_timer.start(500)
+    dialog.show()
+    app.exec()
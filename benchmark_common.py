@@ -0,0 +1,46 @@
+import os
+import subprocess
+
+import numpy as np
+
+
+def summarize(samples):
+    # Latency percentiles in milliseconds
+    values = np.array(samples) * 1000.0
+    return {
+        'count': len(values),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_entries(old, new):
+    # Print the ratio of every latency/time metric against a previous run
+    for name, value in new.items():
+        if not isinstance(value, dict) or name not in old:
+            continue
+        key = 'p50_ms' if 'p50_ms' in value else 'seconds'
+        if old[name].get(key):
+            print(f'{name:32} {key:8} {old[name][key]:10.3f} -> {value[key]:10.3f} '
+                  f'({value[key] / old[name][key]:.2f}x)')
+
+
+def compare_sizes(results, baseline, size_key):
+    # compare_entries for every size both runs have, matched on size_key
+    old_sizes = {entry[size_key]: entry for entry in baseline['sizes']}
+    for entry in results['sizes']:
+        old = old_sizes.get(entry[size_key])
+        if old is not None:
+            print(f'--- {entry[size_key]} {size_key} ---')
+            compare_entries(old, entry)
@@ -1,174 +1,1702 @@
-import sys
-import subprocess
-from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QPlainTextEdit, QFileDialog, QMessageBox,
-    QVBoxLayout, QWidget, QMenuBar, QMenu, QPushButton, QSplitter
-)
-from PySide6.QtGui import QKeySequence, QAction, QSyntaxHighlighter, QTextCharFormat, QColor, QTextCursor
-from PySide6.QtCore import Qt, QRegularExpression, QPoint, QRect
-
-class PythonHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        
-        # Define text formats for different types of syntax
-        self.highlighting_rules = []
-
-        # Keyword format
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(QColor("blue"))
-        keywords = ["def", "class", "import", "from", "return", "if", "elif", "else", "for", "while", "break", "continue", "try", "except", "finally", "with"]
-        self.highlighting_rules += [(QRegularExpression(f"\\b{keyword}\\b"), keyword_format) for keyword in keywords]
-
-        # String format
-        string_format = QTextCharFormat()
-        string_format.setForeground(QColor("green"))
-        self.highlighting_rules.append((QRegularExpression('".*?"'), string_format))
-        self.highlighting_rules.append((QRegularExpression("'.*?'"), string_format))
-
-        # Comment format
-        comment_format = QTextCharFormat()
-        comment_format.setForeground(QColor("gray"))
-        self.highlighting_rules.append((QRegularExpression("#[^\n]*"), comment_format))
-
-    def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            expression = QRegularExpression(pattern)
-            index = expression.match(text).capturedStart()
-            while index >= 0:
-                length = expression.match(text).capturedLength()
-                self.setFormat(index, length, format)
-                index = expression.match(text, index + length).capturedStart()
-
-class CodeEditor(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Code Editor")
-        self.setGeometry(100, 100, 800, 600)
-        
-        self.init_ui()
-        self.init_menu()
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #2e2e2e;
-            }
-            QPlainTextEdit {
-                background-color: #1e1e1e;
-                color: #dcdcdc;
-                border: 1px solid #444;
-                font-family: Courier New;
-                font-size: 12pt;
-            }
-            QPushButton {
-                background-color: #007acc;
-                color: white;
-                border: none;
-                padding: 10px;
-                font-size: 14pt;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #005f99;
-            }
-            QMenuBar {
-                background-color: #333;
-                color: white;
-            }
-            QMenuBar::item:selected {
-                background-color: #555;
-            }
-            QMenu {
-                background-color: #333;
-                color: white;
-            }
-            QMenu::item:selected {
-                background-color: #555;
-            }
-        """)
-
-    def init_ui(self):
-        self.splitter = QSplitter(Qt.Horizontal, self)
-        
-        self.text_area = QPlainTextEdit(self)
-        self.output_area = QPlainTextEdit(self)
-        self.output_area.setReadOnly(True)
-
-        # Apply syntax highlighting to text_area
-        self.highlighter = PythonHighlighter(self.text_area.document())
-
-        self.splitter.addWidget(self.text_area)
-        self.splitter.addWidget(self.output_area)
-        
-        self.run_button = QPushButton("Run Code", self)
-        self.run_button.clicked.connect(self.run_code)
-
-        layout = QVBoxLayout()
-        layout.addWidget(self.splitter)
-        layout.addWidget(self.run_button)
-        layout.setStretch(0, 3)
-        layout.setStretch(1, 0)
-
-        container = QWidget()
-        container.setLayout(layout)
-        self.setCentralWidget(container)
-
-    def init_menu(self):
-        menu_bar = self.menuBar()
-        
-        file_menu = menu_bar.addMenu("File")
-        
-        open_action = QAction("Open", self)
-        open_action.setShortcut(QKeySequence.Open)
-        open_action.triggered.connect(self.open_file)
-        file_menu.addAction(open_action)
-        
-        save_action = QAction("Save", self)
-        save_action.setShortcut(QKeySequence.Save)
-        save_action.triggered.connect(self.save_file)
-        file_menu.addAction(save_action)
-        
-        exit_action = QAction("Exit", self)
-        exit_action.setShortcut("Ctrl+Q")
-        exit_action.triggered.connect(self.exit_editor)
-        file_menu.addAction(exit_action)
-
-    def open_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*);;Text Files (*.txt);;Python Files (*.py)")
-        if file_path:
-            try:
-                with open(file_path, "r") as file:
-                    self.text_area.setPlainText(file.read())
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
-
-    def save_file(self):
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save File", "", "All Files (*);;Text Files (*.txt);;Python Files (*.py)")
-        if file_path:
-            try:
-                with open(file_path, "w") as file:
-                    file.write(self.text_area.toPlainText())
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
-
-    def exit_editor(self):
-        if QMessageBox.question(self, "Quit", "Do you want to quit?", QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
-            self.close()
-
-    def run_code(self):
-        code = self.text_area.toPlainText()
-        try:
-            process = subprocess.Popen(
-                [sys.executable, '-c', code],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = process.communicate()
-            self.output_area.setPlainText(stdout.decode('utf-8') + stderr.decode('utf-8'))
-        except Exception as e:
-            self.output_area.setPlainText(str(e))
-
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    editor = CodeEditor()
-    editor.show()
-    sys.exit(app.exec())
+import sys
+import os
+import io
+import json
+import codecs
+import signal
+import socket
+import struct
+import subprocess
+import keyword
+import tokenize
+import re
+import mmap
+import shutil
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import partial
+from PySide6.QtWidgets import (
+    QApplication, QMainWindow, QPlainTextEdit, QFileDialog, QMessageBox,
+    QVBoxLayout, QWidget, QMenuBar, QMenu, QPushButton, QSplitter, QHBoxLayout, QInputDialog, QProgressBar,
+    QLineEdit, QCheckBox, QLabel, QTextEdit, QTabWidget, QTableWidget, QTableWidgetItem, QHeaderView
+)
+from PySide6.QtGui import QKeySequence, QAction, QSyntaxHighlighter, QTextCharFormat, QColor, QTextCursor, QShortcut, \
+    QDesktopServices
+from PySide6.QtCore import Qt, QRegularExpression, QPoint, QRect, QObject, QThreadPool, QTimer, Signal, QProcess, \
+    QElapsedTimer, QSocketNotifier, QUrl
+
+class PythonHighlighter(QSyntaxHighlighter):
+    # Block states: a block either ends normally or inside a triple-quoted
+    # string, which then carries on into the next block
+    NORMAL = 0
+    TRIPLE_DOUBLE = 1
+    TRIPLE_SINGLE = 2
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        
+        # Define text formats for different types of syntax
+        self.keyword_format = QTextCharFormat()
+        self.keyword_format.setForeground(QColor("blue"))
+        keywords = ["def", "class", "import", "from", "return", "if", "elif", "else", "for", "while", "break", "continue", "try", "except", "finally", "with"]
+
+        self.string_format = QTextCharFormat()
+        self.string_format.setForeground(QColor("green"))
+
+        self.comment_format = QTextCharFormat()
+        self.comment_format.setForeground(QColor("gray"))
+
+        # All rules in one expression, compiled once. Every alternative is its
+        # own capture group, so lastCapturedIndex() says which rule matched, and
+        # the leftmost match wins, so a '#' inside a string stays a string.
+        self.expression = QRegularExpression(
+            "(\"\"\"|''')"                                        # 1: triple-quoted string
+            "|(\"(?:[^\"\\\\]|\\\\.)*\"|'(?:[^'\\\\]|\\\\.)*')"   # 2: string
+            "|(#.*)"                                              # 3: comment
+            f"|\\b({'|'.join(keywords)})\\b"                      # 4: keyword
+        )
+        self.expression.optimize()
+        self.group_formats = {2: self.string_format, 3: self.comment_format, 4: self.keyword_format}
+        self.closing_expressions = {
+            self.TRIPLE_DOUBLE: QRegularExpression('"""'),
+            self.TRIPLE_SINGLE: QRegularExpression("'''"),
+        }
+
+    def highlightBlock(self, text):
+        # One left-to-right pass over the block. QSyntaxHighlighter only moves
+        # on to the following blocks when a block's end state changes, so an
+        # edit rehighlights just the lines it can affect.
+        self.setCurrentBlockState(self.NORMAL)
+        position = 0
+        if self.previousBlockState() in self.closing_expressions:
+            position = self.close_string(text, 0, 0, self.previousBlockState())
+
+        while position >= 0:
+            match = self.expression.match(text, position)
+            if not match.hasMatch():
+                break
+            group = match.lastCapturedIndex()
+            start, end = match.capturedStart(), match.capturedEnd()
+            if group == 1:
+                state = self.TRIPLE_DOUBLE if match.captured(1) == '"""' else self.TRIPLE_SINGLE
+                position = self.close_string(text, start, end, state)
+            else:
+                self.setFormat(start, end - start, self.group_formats[group])
+                position = end
+
+    def close_string(self, text, start, search_from, state):
+        # Format a triple-quoted string from `start` to its closing quotes and
+        # return the position after them, or -1 if it runs past this block
+        match = self.closing_expressions[state].match(text, search_from)
+        if not match.hasMatch():
+            self.setFormat(start, self.currentBlock().length() - start, self.string_format)
+            self.setCurrentBlockState(state)
+            return -1
+        self.setFormat(start, match.capturedEnd() - start, self.string_format)
+        return match.capturedEnd()
+
+# f-strings are split into several tokens from Python 3.12 on
+FSTRING_START = getattr(tokenize, "FSTRING_START", tokenize.STRING)
+STRING_TOKENS = {tokenize.STRING, FSTRING_START, getattr(tokenize, "FSTRING_MIDDLE", tokenize.STRING),
+                 getattr(tokenize, "FSTRING_END", tokenize.STRING)}
+
+
+def utf16_length(text):
+    # Qt positions count UTF-16 code units, Python counts code points
+    return len(text) if text.isascii() else len(text.encode("utf-16-le")) // 2
+
+
+def tokenize_lines(text):
+    # Token spans for every line of a document snapshot, as (line text,
+    # [(start, length, kind)], end state). Lines after a tokenize error are
+    # None, and fall back to the regex rules.
+    lines = text.split("\n")
+    spans = [[] for _ in lines]
+    states = [PythonHighlighter.NORMAL] * len(lines)
+    last_row = len(lines)
+    quote = '"'
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            if token.type in STRING_TOKENS:
+                kind = "string"
+                if token.type in (tokenize.STRING, FSTRING_START):
+                    quote = token.string.lstrip("rRbBuUfF")[:1]
+            elif token.type == tokenize.COMMENT:
+                kind = "comment"
+            elif token.type == tokenize.NAME and keyword.iskeyword(token.string):
+                kind = "keyword"
+            else:
+                continue
+            (start_row, start_col), (end_row, end_col) = token.start, token.end
+            for row in range(start_row, min(end_row, len(lines)) + 1):
+                line = lines[row - 1]
+                first = utf16_length(line[:start_col]) if row == start_row else 0
+                last = utf16_length(line[:end_col]) if row == end_row else utf16_length(line)
+                spans[row - 1].append((first, last - first, kind))
+                if row < end_row:
+                    states[row - 1] = PythonHighlighter.TRIPLE_DOUBLE if quote == '"' else PythonHighlighter.TRIPLE_SINGLE
+    except tokenize.TokenError as e:
+        last_row = e.args[1][0] - 1
+    except SyntaxError as e:
+        last_row = (e.lineno or 1) - 1
+    return [(line, spans[row], states[row]) if row < last_row else None for row, line in enumerate(lines)]
+
+
+class TokenSignals(QObject):
+    # Carries tokenize results from the worker thread back to the GUI thread
+    finished = Signal(int, object)
+
+
+def run_tokenize_job(generation, text, signals):
+    signals.finished.emit(generation, tokenize_lines(text))
+
+
+class TokenHighlighter(PythonHighlighter):
+    # Highlighting from the stdlib tokenizer, so it gets Python right. A
+    # snapshot of the document is tokenized on a worker thread and the result
+    # is kept as a per-block cache of spans; a block whose text still matches
+    # its cache entry is formatted straight from it. Changed blocks are then
+    # rehighlighted a batch per event-loop turn, visible ones first. Until
+    # tokens arrive, visible blocks use the regex rules and the rest stay plain.
+    BATCH_SIZE = 500
+
+    def __init__(self, text_edit):
+        super().__init__(text_edit.document())
+        self.text_edit = text_edit
+        self.formats = {"keyword": self.keyword_format, "string": self.string_format, "comment": self.comment_format}
+        self.lines = []        # Block number -> (text, spans, end state) from the last tokenize run
+        self.pending = set()   # Blocks shown without their tokens
+        self.visible = (0, 100)
+        self.generation = 0
+        self.running = False
+        self.dirty = False
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = TokenSignals(self)
+        self.signals.finished.connect(self.on_tokens)
+
+        # Tokenize once typing pauses rather than on every keystroke
+        self.tokenize_timer = QTimer(self)
+        self.tokenize_timer.setSingleShot(True)
+        self.tokenize_timer.setInterval(200)
+        self.tokenize_timer.timeout.connect(self.start_tokenize)
+
+        self.apply_queue = deque()
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setInterval(0)
+        self.apply_timer.timeout.connect(self.apply_batch)
+
+        self.document().contentsChange.connect(self.schedule_tokenize)
+        self.text_edit.verticalScrollBar().valueChanged.connect(self.apply_visible)
+        self.schedule_tokenize()
+
+    def highlightBlock(self, text):
+        number = self.currentBlock().blockNumber()
+        entry = self.lines[number] if number < len(self.lines) else False
+        if entry and entry[0] == text:
+            for start, length, kind in entry[1]:
+                self.setFormat(start, length, self.formats[kind])
+            self.setCurrentBlockState(entry[2])
+            self.pending.discard(number)
+        elif entry is None or self.visible[0] <= number <= self.visible[1]:
+            super().highlightBlock(text)
+            self.pending.add(number)
+        else:
+            # Keep any old state, so Qt does not cascade into the next block
+            self.setCurrentBlockState(max(self.NORMAL, self.currentBlockState()))
+            self.pending.add(number)
+
+    def schedule_tokenize(self, *args):
+        self.generation += 1
+        self.tokenize_timer.start()
+
+    def start_tokenize(self):
+        if self.document() is None:
+            return  # Replaced by another highlighter
+        if self.running:
+            self.dirty = True
+            return
+        self.running = True
+        self.pool.start(partial(run_tokenize_job, self.generation, self.document().toPlainText(), self.signals))
+
+    def on_tokens(self, generation, lines):
+        self.running = False
+        if self.document() is None:
+            return
+        if self.dirty:
+            self.dirty = False
+            self.tokenize_timer.start()
+        if generation != self.generation:
+            return  # The document changed during the run; a newer run is scheduled
+
+        old_lines, self.lines = self.lines, lines
+        changed = set(self.pending)
+        changed.update(number for number in range(len(lines))
+                       if number >= len(old_lines) or old_lines[number] != lines[number])
+        self.update_visible()
+        first, last = self.visible
+        self.apply_queue = deque(sorted(changed, key=lambda number: (not first <= number <= last, number)))
+        self.apply_timer.start()
+
+    def update_visible(self):
+        first = self.text_edit.firstVisibleBlock().blockNumber()
+        viewport = self.text_edit.viewport()
+        last = self.text_edit.cursorForPosition(QPoint(0, viewport.height() - 1)).blockNumber()
+        self.visible = (first, max(first, last))
+
+    def apply_visible(self, *args):
+        # After a scroll, bring the newly visible blocks up to date at once
+        self.update_visible()
+        document = self.document()
+        for number in range(self.visible[0], self.visible[1] + 1):
+            if number in self.pending:
+                self.rehighlightBlock(document.findBlockByNumber(number))
+
+    def apply_batch(self):
+        document = self.document()
+        for _ in range(min(self.BATCH_SIZE, len(self.apply_queue))):
+            block = document.findBlockByNumber(self.apply_queue.popleft())
+            if block.isValid():
+                self.rehighlightBlock(block)
+        if not self.apply_queue:
+            self.apply_timer.stop()
+
+
+# Runs in the warm interpreter: preload the modules named on the command
+# line, then fork one child per script received on the control socket. The
+# child gets the editor's pipes as stdout/stderr and a fresh __main__
+# namespace; the server itself never runs user code.
+FORK_SERVER_SOURCE = r"""
+import atexit, importlib, os, socket, struct, sys, threading, traceback, types
+control = socket.socket(fileno=int(sys.argv[1]))
+for name in sys.argv[2:]:
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        print(f"Could not preload {name}: {e}", file=sys.stderr)
+control.sendall(b"R")
+while True:
+    header, fds, _, _ = socket.recv_fds(control, 8, 2)
+    if len(header) < 8:
+        break
+    size = struct.unpack("<Q", header)[0]
+    code = b""
+    while len(code) < size:
+        code += control.recv(size - len(code))
+    pid = os.fork()
+    if pid == 0:
+        control.close()
+        os.setpgid(0, 0)
+        stdin = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(stdin, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds + [stdin]:
+            os.close(fd)
+        sys.argv = ["-c"]
+        # A fresh __main__, so "import __main__" doesn't hand the script this server's globals
+        main = types.ModuleType("__main__")
+        main.__builtins__ = __builtins__
+        sys.modules["__main__"] = main
+        exit_code = 0
+        try:
+            exec(compile(code.decode("utf-8"), "<string>", "exec"), main.__dict__)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException as e:
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = 1
+        # Shut down like a normal interpreter: wait for non-daemon threads, then atexit
+        threading._shutdown()
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+    for fd in fds:
+        os.close(fd)
+    control.sendall(struct.pack("<Bq", 0, pid))
+    _, status = os.waitpid(pid, 0)
+    control.sendall(struct.pack("<Bq", 1, os.waitstatus_to_exitcode(status)))
+"""
+
+
+class WarmRun(QObject):
+    # One script running in a child forked from a ForkServer. Offers the
+    # parts of QProcess the editor uses: terminate(), kill() and finished.
+    text_ready = Signal(str)
+    finished = Signal(int, QProcess.ExitStatus)
+
+    def __init__(self, server, code, parent=None):
+        super().__init__(parent)
+        self.server = server
+        self.pid = None
+        self.pending_signal = None
+        self.control_buffer = b""
+        self.decoders = {}
+        self.notifiers = {}
+
+        output_fds = []
+        for _ in range(2):
+            read_fd, write_fd = os.pipe()
+            os.set_blocking(read_fd, False)
+            output_fds.append(write_fd)
+            self.decoders[read_fd] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            notifier = QSocketNotifier(read_fd, QSocketNotifier.Read, self)
+            notifier.activated.connect(lambda *args, fd=read_fd: self.read_pipe(fd))
+            self.notifiers[read_fd] = notifier
+        payload = code.encode("utf-8")
+        try:
+            socket.send_fds(server.control, [struct.pack("<Q", len(payload))], output_fds)
+            server.control.sendall(payload)
+        except OSError:
+            for fd in list(self.notifiers):
+                self.close_pipe(fd)
+            raise
+        finally:
+            for fd in output_fds:
+                os.close(fd)
+
+        self.control_notifier = QSocketNotifier(server.control.fileno(), QSocketNotifier.Read, self)
+        self.control_notifier.activated.connect(self.read_control)
+
+    def read_pipe(self, fd):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if data:
+            self.text_ready.emit(self.decoders[fd].decode(data))
+        else:
+            self.close_pipe(fd)
+
+    def close_pipe(self, fd):
+        notifier = self.notifiers.pop(fd, None)
+        if notifier is not None:
+            notifier.setEnabled(False)
+            os.close(fd)
+
+    def read_control(self, *args):
+        data = self.server.control.recv(4096)
+        if not data:
+            self.finish(-1, QProcess.CrashExit, server_alive=False)
+            return
+        self.control_buffer += data
+        while len(self.control_buffer) >= 9:
+            kind, value = struct.unpack("<Bq", self.control_buffer[:9])
+            self.control_buffer = self.control_buffer[9:]
+            if kind == 0:
+                self.pid = value
+                if self.pending_signal is not None:
+                    self.send_signal(self.pending_signal)
+            else:
+                self.finish(value, QProcess.NormalExit if value >= 0 else QProcess.CrashExit)
+
+    def finish(self, exit_code, exit_status, server_alive=True):
+        self.control_notifier.setEnabled(False)
+        # Pick up whatever output is still in the pipes
+        for fd in list(self.notifiers):
+            while fd in self.notifiers:
+                try:
+                    data = os.read(fd, 65536)
+                except BlockingIOError:
+                    break
+                if data:
+                    self.text_ready.emit(self.decoders[fd].decode(data))
+                else:
+                    self.close_pipe(fd)
+            self.close_pipe(fd)
+        self.server.run_finished(server_alive)
+        self.finished.emit(exit_code, exit_status)
+
+    def send_signal(self, signal_number):
+        if self.pid is None:
+            self.pending_signal = signal_number
+            return
+        try:
+            os.killpg(self.pid, signal_number)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class ForkServer(QObject):
+    # A warm interpreter that has already imported the preload modules.
+    # Starting it (and importing) happens in the background; it reports
+    # ready on its control socket.
+    ready_changed = Signal()
+
+    def __init__(self, modules, parent=None):
+        super().__init__(parent)
+        self.modules = list(modules)
+        self.ready = False
+        self.busy = False
+        self.runs = 0
+        self.control, child_control = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "-c", FORK_SERVER_SOURCE, str(child_control.fileno())] + self.modules,
+            pass_fds=(child_control.fileno(),), stdin=subprocess.DEVNULL)
+        child_control.close()
+        self.ready_notifier = QSocketNotifier(self.control.fileno(), QSocketNotifier.Read, self)
+        self.ready_notifier.activated.connect(self.on_ready)
+
+    def on_ready(self, *args):
+        self.ready_notifier.setEnabled(False)
+        self.ready = self.control.recv(1) == b"R"
+        self.ready_changed.emit()
+
+    def run(self, code, parent=None):
+        self.busy = True
+        self.runs += 1
+        return WarmRun(self, code, parent)
+
+    def run_finished(self, alive):
+        self.busy = False
+        self.ready = self.ready and alive and self.process.poll() is None
+        self.ready_changed.emit()
+
+    def close(self):
+        self.ready = False
+        self.ready_notifier.setEnabled(False)
+        self.control.close()  # The server exits when its socket closes
+        try:
+            self.process.wait(1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class WarmInterpreterPool(QObject):
+    # Keeps a warm fork server ready so Run skips interpreter startup and
+    # module imports. Each run forks a child from it, so runs start in a few
+    # milliseconds yet never see each other's state. After max_runs runs (or
+    # if it dies) a replacement is warmed up in the background and swapped
+    # in once it is idle; until a server is ready, runs start cold.
+    def __init__(self, modules=(), max_runs=100, parent=None):
+        super().__init__(parent)
+        self.modules = list(modules)
+        self.max_runs = max_runs
+        self.current = None
+        self.spare = None
+        self.retired = []  # Replaced servers, closed once their run ends
+        self.set_modules(modules)
+
+    def set_modules(self, modules):
+        self.modules = list(modules)
+        self.retired += [server for server in (self.current, self.spare) if server is not None]
+        self.current = self.new_server()
+        self.spare = None
+        self.close_retired()
+
+    def close_retired(self):
+        for server in [server for server in self.retired if not server.busy]:
+            server.close()
+            self.retired.remove(server)
+
+    def new_server(self):
+        server = ForkServer(self.modules, self)
+        server.ready_changed.connect(self.recycle)
+        return server
+
+    def recycle(self):
+        # Called whenever a server becomes ready or finishes a run
+        self.close_retired()
+        if self.current.busy:
+            return
+        if self.spare is None and (self.current.runs >= self.max_runs or
+                                   (self.current.process.poll() is not None)):
+            self.spare = self.new_server()
+        if self.spare is not None and self.spare.ready:
+            self.retired.append(self.current)
+            self.current, self.spare = self.spare, None
+            self.close_retired()
+
+    def start_run(self, code, parent=None):
+        # A WarmRun, or None if no warm server is free right now
+        if self.current.process.poll() is not None:
+            self.current.ready = False
+            self.recycle()
+        if not self.current.ready or self.current.busy:
+            return None
+        try:
+            return self.current.run(code, parent)
+        except OSError:
+            self.current.busy = self.current.ready = False
+            self.recycle()
+            return None
+
+    def close(self):
+        for server in [self.current, self.spare] + self.retired:
+            if server is not None:
+                server.close()
+
+
+CODING_COOKIE = re.compile(rb"^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)")
+BOMS = [(codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+
+
+def detect_encoding(head):
+    # A byte-order mark, else a PEP 263 coding cookie in the first two lines,
+    # else UTF-8 if the head decodes as UTF-8, else Latin-1 (which round-trips
+    # any bytes unchanged)
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    for line in head.split(b"\n")[:2]:
+        match = CODING_COOKIE.match(line)
+        if match:
+            try:
+                return codecs.lookup(match.group(1).decode("ascii")).name
+            except LookupError:
+                break
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+class FileLoad:
+    # One background file load; the worker stops when it is cancelled, and
+    # never has more than `slots` decoded chunks waiting for the GUI thread
+    def __init__(self, load_id, slots=4):
+        self.id = load_id
+        self.cancelled = threading.Event()
+        self.slots = threading.Semaphore(slots)
+
+
+class LoadSignals(QObject):
+    chunk_ready = Signal(int, str, int)   # load id, text, percent done
+    restarted = Signal(int)               # load id; the chunks so far are void
+    finished = Signal(int, str, str)      # load id, encoding, error message
+
+
+def emit_chunks(load, data, encoding, signals, chunk_size):
+    # Decode strictly, translating line endings on the way, and hand each
+    # chunk to the GUI thread; False if the load was cancelled
+    size = len(data)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    for position in range(0, size, chunk_size):
+        end = min(position + chunk_size, size)
+        text = decoder.decode(data[position:end], final=end == size)
+        while not load.slots.acquire(timeout=0.1):
+            if load.cancelled.is_set():
+                return False
+        if load.cancelled.is_set():
+            return False
+        signals.chunk_ready.emit(load.id, text, end * 100 // size)
+    return True
+
+
+def run_load_job(load, file_path, signals, chunk_size=1 << 18):
+    # Decode the file from a memory map a chunk at a time
+    encoding = ""
+    try:
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                signals.finished.emit(load.id, "utf-8", "")
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding = detect_encoding(data[:4096])
+                try:
+                    completed = emit_chunks(load, data, encoding, signals, chunk_size)
+                except UnicodeDecodeError:
+                    # A bad byte past the sniffed head: start over as Latin-1,
+                    # which round-trips any bytes, so saving can't corrupt it
+                    encoding = "latin-1"
+                    signals.restarted.emit(load.id)
+                    completed = emit_chunks(load, data, encoding, signals, chunk_size)
+                if not completed:
+                    return
+        signals.finished.emit(load.id, encoding, "")
+    except (OSError, ValueError, LookupError) as e:
+        signals.finished.emit(load.id, encoding, str(e))
+
+
+def save_document(document, file_path, encoding="utf-8", blocks_per_write=4096):
+    # Stream the document a run of blocks at a time into a temporary file
+    # next to the target, then rename it over the target: a crash leaves
+    # either the old file or the new one, never a truncated one
+    directory = os.path.dirname(os.path.abspath(file_path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with open(descriptor, "w", encoding=encoding, newline="\n") as file:
+            cursor = QTextCursor(document)
+            for first in range(0, document.blockCount(), blocks_per_write):
+                last = document.findBlockByNumber(min(first + blocks_per_write, document.blockCount()) - 1)
+                cursor.setPosition(document.findBlockByNumber(first).position())
+                cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+                file.write(cursor.selectedText().replace("\u2029", "\n"))
+                if last.next().isValid():
+                    file.write("\n")
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+ASTRAL_CHARACTER = re.compile("[\U00010000-\U0010ffff]")
+
+
+class Utf16Positions:
+    # Converts between Python string indices and Qt (UTF-16) positions; the
+    # two only differ after characters outside the Basic Multilingual Plane
+    def __init__(self, text):
+        self.astral = [match.start() for match in ASTRAL_CHARACTER.finditer(text)]
+        self.astral_qt = [index + count for count, index in enumerate(self.astral)]
+
+    def to_qt(self, index):
+        return index + bisect_left(self.astral, index) if self.astral else index
+
+    def from_qt(self, position):
+        return position - bisect_left(self.astral_qt, position) if self.astral else position
+
+
+def document_text(document, start=0, end=None):
+    # Text of a document range; unlike toPlainText() this keeps non-breaking
+    # spaces, so it matches the document character for character
+    cursor = QTextCursor(document)
+    cursor.setPosition(start)
+    if end is None:
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+    else:
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+    return cursor.selectedText().replace("\u2029", "\n")
+
+
+def find_matches(pattern, text, offset=0):
+    # (start, length) of every non-empty match, in Qt positions
+    positions = Utf16Positions(text)
+    for match in pattern.finditer(text):
+        if match.end() > match.start():
+            start = positions.to_qt(match.start())
+            yield offset + start, positions.to_qt(match.end()) - start
+
+
+class SearchRun:
+    def __init__(self, search_id):
+        self.id = search_id
+        self.cancelled = threading.Event()
+
+
+class SearchSignals(QObject):
+    matches_found = Signal(int, object)   # search id, [(start, length)]
+    finished = Signal(int)
+
+
+def run_search_job(search, text, pattern, signals, batch_size=5000):
+    batch = []
+    for match in find_matches(pattern, text):
+        if search.cancelled.is_set():
+            return
+        batch.append(match)
+        if len(batch) >= batch_size:
+            signals.matches_found.emit(search.id, batch)
+            batch = []
+    if batch:
+        signals.matches_found.emit(search.id, batch)
+    signals.finished.emit(search.id)
+
+
+class FindBar(QWidget):
+    # Find/replace for a QPlainTextEdit. A search runs on a worker over a
+    # snapshot of the document and streams its matches into a sorted index of
+    # start positions and lengths. Edits patch the index from contentsChange
+    # (matches after the edit shift, only the edited blocks are searched
+    # again), so typing never triggers a full search. Only the matches on
+    # screen are highlighted.
+    def __init__(self, text_edit, parent=None):
+        super().__init__(parent)
+        self.text_edit = text_edit
+        self.document = text_edit.document()
+        self.pattern = None
+        self.starts, self.lengths = [], []
+        self.current = -1
+        self.search = None
+        self.search_count = 0
+        self.replacing = False
+
+        self.match_format = QTextCharFormat()
+        self.match_format.setBackground(QColor("#515c6a"))
+        self.current_format = QTextCharFormat()
+        self.current_format.setBackground(QColor("#b58900"))
+
+        self.find_input = QLineEdit(self)
+        self.find_input.setPlaceholderText("Find")
+        self.replace_input = QLineEdit(self)
+        self.replace_input.setPlaceholderText("Replace")
+        self.regex_box = QCheckBox("Regex", self)
+        self.case_box = QCheckBox("Match case", self)
+        self.status_label = QLabel(self)
+        previous_button = QPushButton("Previous", self)
+        next_button = QPushButton("Next", self)
+        replace_button = QPushButton("Replace", self)
+        replace_all_button = QPushButton("Replace All", self)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        for widget in (self.find_input, self.replace_input, self.regex_box, self.case_box, previous_button,
+                       next_button, replace_button, replace_all_button, self.status_label):
+            layout.addWidget(widget)
+        self.setLayout(layout)
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.signals = SearchSignals(self)
+        self.signals.matches_found.connect(self.on_matches_found)
+        self.signals.finished.connect(self.on_search_finished)
+
+        # Search once typing pauses, and refresh highlights at most once per
+        # event-loop turn
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.start_search)
+        self.highlight_timer = QTimer(self)
+        self.highlight_timer.setSingleShot(True)
+        self.highlight_timer.setInterval(0)
+        self.highlight_timer.timeout.connect(self.refresh_highlights)
+
+        self.find_input.textChanged.connect(self.schedule_search)
+        self.find_input.returnPressed.connect(self.find_next)
+        self.regex_box.toggled.connect(self.schedule_search)
+        self.case_box.toggled.connect(self.schedule_search)
+        previous_button.clicked.connect(lambda: self.find_next(backward=True))
+        next_button.clicked.connect(lambda: self.find_next())
+        replace_button.clicked.connect(self.replace_current)
+        replace_all_button.clicked.connect(self.replace_all)
+        self.document.contentsChange.connect(self.on_contents_change)
+        self.text_edit.verticalScrollBar().valueChanged.connect(self.schedule_highlight)
+        QShortcut(QKeySequence(Qt.Key_Escape), self, self.close_bar, context=Qt.WidgetWithChildrenShortcut)
+
+    def open_bar(self, replace=False):
+        self.show()
+        selected = self.text_edit.textCursor().selectedText()
+        if selected and "\u2029" not in selected:
+            self.find_input.setText(selected)
+        field = self.replace_input if replace else self.find_input
+        field.setFocus()
+        field.selectAll()
+        self.schedule_search()
+
+    def close_bar(self):
+        self.hide()
+        self.cancel_search()
+        self.pattern = None
+        self.starts, self.lengths = [], []
+        self.text_edit.setExtraSelections([])
+        self.text_edit.setFocus()
+
+    def schedule_search(self, *args):
+        self.search_timer.start()
+
+    def schedule_highlight(self, *args):
+        self.highlight_timer.start()
+
+    def compile_pattern(self):
+        text = self.find_input.text()
+        if not text:
+            return None
+        flags = re.MULTILINE | (0 if self.case_box.isChecked() else re.IGNORECASE)
+        return re.compile(text if self.regex_box.isChecked() else re.escape(text), flags)
+
+    def cancel_search(self):
+        if self.search is not None:
+            self.search.cancelled.set()
+            self.search = None
+
+    def start_search(self):
+        self.cancel_search()
+        self.starts, self.lengths = [], []
+        self.current = -1
+        try:
+            self.pattern = self.compile_pattern() if self.isVisible() else None
+        except re.error as e:
+            self.pattern = None
+            self.status_label.setText(f"Invalid pattern: {e}")
+            self.schedule_highlight()
+            return
+        self.status_label.setText("Searching..." if self.pattern is not None else "")
+        self.schedule_highlight()
+        if self.pattern is not None:
+            self.search_count += 1
+            self.search = SearchRun(self.search_count)
+            self.pool.start(partial(run_search_job, self.search, document_text(self.document), self.pattern,
+                                    self.signals))
+
+    def on_matches_found(self, search_id, matches):
+        if self.search is None or search_id != self.search.id:
+            return
+        for start, length in matches:
+            self.starts.append(start)
+            self.lengths.append(length)
+        self.status_label.setText(f"{len(self.starts)} matches so far...")
+        self.schedule_highlight()
+
+    def on_search_finished(self, search_id):
+        if self.search is None or search_id != self.search.id:
+            return
+        self.search = None
+        self.status_label.setText(f"{len(self.starts)} matches")
+
+    def on_contents_change(self, position, removed, added):
+        if self.pattern is None or self.replacing:
+            return
+        if self.search is not None:
+            # The running search works on an older snapshot: start over
+            self.schedule_search()
+            return
+        delta = added - removed
+        start_block = self.document.findBlock(position)
+        end_block = self.document.findBlock(position + added)
+        region_start = start_block.position()
+        region_end = end_block.position() + end_block.length() - 1  # New positions
+
+        # Drop the matches that touch the edited blocks (old positions),
+        # widening the region to cover any that spill out of it
+        first = bisect_left(self.starts, region_start)
+        if first > 0 and self.starts[first - 1] + self.lengths[first - 1] > region_start:
+            first -= 1
+            region_start = self.starts[first]
+        last = bisect_left(self.starts, region_end - delta)
+        if last > first:
+            region_end = max(region_end, self.starts[last - 1] + self.lengths[last - 1] + delta)
+        region_end = min(region_end, self.document.characterCount() - 1)
+
+        found = list(find_matches(self.pattern, document_text(self.document, region_start, region_end), region_start))
+        self.starts[first:] = [start for start, _ in found] + [start + delta for start in self.starts[last:]]
+        self.lengths[first:] = [length for _, length in found] + self.lengths[last:]
+        self.current = -1
+        self.status_label.setText(f"{len(self.starts)} matches")
+        self.schedule_highlight()
+
+    def refresh_highlights(self):
+        # Highlight only the matches between the first and last visible blocks
+        selections = []
+        if self.starts:
+            viewport = self.text_edit.viewport()
+            top = self.text_edit.firstVisibleBlock().position()
+            bottom_block = self.text_edit.cursorForPosition(QPoint(viewport.width() - 1, viewport.height() - 1)).block()
+            bottom = bottom_block.position() + bottom_block.length()
+            index = bisect_left(self.starts, top)
+            if index > 0 and self.starts[index - 1] + self.lengths[index - 1] > top:
+                index -= 1
+            while index < len(self.starts) and self.starts[index] < bottom:
+                selection = QTextEdit.ExtraSelection()
+                selection.cursor = QTextCursor(self.document)
+                selection.cursor.setPosition(self.starts[index])
+                selection.cursor.setPosition(self.starts[index] + self.lengths[index], QTextCursor.KeepAnchor)
+                selection.format = self.current_format if index == self.current else self.match_format
+                selections.append(selection)
+                index += 1
+        self.text_edit.setExtraSelections(selections)
+
+    def find_next(self, backward=False):
+        if not self.starts:
+            return
+        cursor = self.text_edit.textCursor()
+        if backward:
+            index = bisect_left(self.starts, cursor.selectionStart()) - 1
+            index = index if index >= 0 else len(self.starts) - 1
+        else:
+            index = bisect_left(self.starts, cursor.selectionEnd() if cursor.hasSelection() else cursor.position())
+            index = index if index < len(self.starts) else 0
+        self.select_match(index)
+
+    def select_match(self, index):
+        self.current = index
+        cursor = self.text_edit.textCursor()
+        cursor.setPosition(self.starts[index])
+        cursor.setPosition(self.starts[index] + self.lengths[index], QTextCursor.KeepAnchor)
+        self.text_edit.setTextCursor(cursor)
+        self.text_edit.ensureCursorVisible()
+        self.status_label.setText(f"{index + 1} of {len(self.starts)}")
+        self.schedule_highlight()
+
+    def replacement_for(self, text, start, end, expanded=None):
+        # Replacement for the match at text[start:end] of a document snapshot.
+        # The pattern is matched again in place, so lookarounds, anchors and
+        # \b see the text around it; None if it no longer matches there.
+        # `expanded` caches expansions by the match's groups, which are all
+        # the template can depend on, since expand() reparses it every call
+        template = self.replace_input.text()
+        if not self.regex_box.isChecked():
+            return template
+        match = self.pattern.match(text, start)
+        if match is None or match.end() != end:
+            return None
+        if "\\" not in template:
+            return template  # Nothing to expand
+        if expanded is None:
+            return match.expand(template)
+        groups = (match.group(0),) + match.groups()
+        if groups not in expanded:
+            expanded[groups] = match.expand(template)
+        return expanded[groups]
+
+    def replace_current(self):
+        cursor = self.text_edit.textCursor()
+        index = self.current
+        if 0 <= index < len(self.starts) and cursor.selectionStart() == self.starts[index] and \
+                cursor.selectionEnd() == self.starts[index] + self.lengths[index]:
+            text = document_text(self.document)
+            positions = Utf16Positions(text)
+            try:
+                replacement = self.replacement_for(text, positions.from_qt(self.starts[index]),
+                                                   positions.from_qt(self.starts[index] + self.lengths[index]))
+            except re.error as e:
+                self.status_label.setText(f"Invalid replacement: {e}")
+                return
+            if replacement is None:
+                self.schedule_search()
+                return
+            cursor.insertText(replacement)
+        self.find_next()
+
+    def replace_all(self):
+        # Rebuild the text between the first and last match from the index and
+        # put it back with one insert: one edit block, one undo step and one
+        # relayout however many matches there are
+        if self.search is not None:
+            self.status_label.setText("Still searching...")
+            return
+        if not self.starts:
+            return
+        first, last = self.starts[0], self.starts[-1] + self.lengths[-1]
+        text = document_text(self.document)
+        positions = Utf16Positions(text)
+        pieces = []
+        previous = positions.from_qt(first)
+        count = 0
+        expanded = {}
+        try:
+            for start, length in zip(self.starts, self.lengths):
+                match_start = positions.from_qt(start)
+                match_end = positions.from_qt(start + length)
+                replacement = self.replacement_for(text, match_start, match_end, expanded)
+                if replacement is None:
+                    continue  # Left as it is
+                pieces.append(text[previous:match_start])
+                pieces.append(replacement)
+                previous = match_end
+                count += 1
+        except re.error as e:
+            self.status_label.setText(f"Invalid replacement: {e}")
+            return
+        pieces.append(text[previous:positions.from_qt(last)])
+
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(first)
+        cursor.setPosition(last, QTextCursor.KeepAnchor)
+        self.replacing = True
+        cursor.beginEditBlock()
+        cursor.insertText("".join(pieces))
+        cursor.endEditBlock()
+        self.replacing = False
+        self.start_search()
+        self.status_label.setText(f"Replaced {count} matches")
+
+
+class OutputPane(QPlainTextEdit):
+    # Read-only sink for program output. Appends are queued and inserted at
+    # most once per interval, the document keeps only the last max_lines
+    # lines, and everything is also written to a log file that can be opened
+    # in full. Memory and repaint cost stay flat however much is printed.
+    def __init__(self, parent=None, max_lines=10000, interval=16):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.document().setUndoRedoEnabled(False)
+        self.max_lines = max_lines
+        self.pending = []
+        self.log_file = None
+        self.log_path = None
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(interval)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def set_max_lines(self, max_lines):
+        self.max_lines = max_lines
+        self.trim(0)
+
+    def append(self, text):
+        if self.log_file is None:
+            self.log_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", errors="replace", newline="",
+                                                        prefix="code-editor-output-", suffix=".log", delete=False)
+            self.log_path = self.log_file.name
+        self.log_file.write(text)
+        self.pending.append(text)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush(self):
+        self.flush_timer.stop()
+        if self.log_file is not None:
+            self.log_file.flush()
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        # Lines that would only be trimmed again are never inserted
+        cut = len(text)
+        for _ in range(self.max_lines):
+            cut = text.rfind("\n", 0, cut)
+            if cut < 0:
+                break
+
+        # Follow the output unless the user has scrolled up to read
+        scroll_bar = self.verticalScrollBar()
+        following = scroll_bar.value() >= scroll_bar.maximum() - 1
+        if cut >= 0:
+            # The new lines fill the pane on their own
+            self.setPlainText(text[cut + 1:])
+        else:
+            self.trim(text.count("\n"))
+            cursor = QTextCursor(self.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        if following:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def trim(self, incoming):
+        # Drop the oldest lines in one removal, which is far cheaper than
+        # letting setMaximumBlockCount() discard them one block at a time
+        document = self.document()
+        excess = document.blockCount() + incoming - self.max_lines
+        if excess > 0:
+            cursor = QTextCursor(document)
+            cursor.setPosition(document.findBlockByNumber(excess).position(), QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+
+    def clear_output(self):
+        self.pending = []
+        self.flush_timer.stop()
+        self.close_log()
+        self.clear()
+
+    def open_log(self):
+        self.flush()
+        if self.log_path is not None:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(self.log_path))
+        return self.log_path
+
+    def close_log(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            os.unlink(self.log_path)
+            self.log_file = None
+            self.log_path = None
+
+
+# Runs a script under cProfile and tracemalloc and writes what they found to
+# the JSON file named on the command line. Allocations are charged to the
+# innermost line of the script on their stack, so library internals roll up
+# to the user's code that called them.
+PROFILER_SOURCE = r"""
+import cProfile, json, linecache, pstats, sys, traceback, tracemalloc
+stats_path, code = sys.argv[1], sys.argv[2]
+sys.argv = ["-c"]
+FILENAME = "<editor>"
+linecache.cache[FILENAME] = (len(code), None, code.splitlines(True), FILENAME)
+namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+exit_code = 0
+profiler = cProfile.Profile()
+tracemalloc.start(16)
+try:
+    compiled = compile(code, FILENAME, "exec")
+    profiler.enable()
+    try:
+        exec(compiled, namespace)
+    finally:
+        profiler.disable()
+except SystemExit as e:
+    exit_code = e.code if e.code is None or isinstance(e.code, int) else 1
+except BaseException as e:
+    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    exit_code = 1
+sys.stdout.flush()
+
+_, peak = tracemalloc.get_traced_memory()
+snapshot = tracemalloc.take_snapshot()
+tracemalloc.stop()
+sites = {}
+for statistic in snapshot.statistics("traceback"):
+    frames = statistic.traceback
+    frame = next((frame for frame in reversed(frames) if frame.filename == FILENAME), frames[-1])
+    if frame.filename in ("<string>", tracemalloc.__file__):
+        continue
+    site = sites.setdefault((frame.filename, frame.lineno), [0, 0])
+    site[0] += statistic.size
+    site[1] += statistic.count
+allocations = [{"file": file, "line": line, "size": size, "count": count}
+               for (file, line), (size, count) in sorted(sites.items(), key=lambda item: -item[1][0])[:200]]
+
+functions = []
+for (file, line, name), (_, calls, total, cumulative, _) in pstats.Stats(profiler).stats.items():
+    if "_lsprof" not in name:
+        functions.append({"file": file, "line": line, "name": name, "calls": calls,
+                          "total": total, "cumulative": cumulative})
+functions.sort(key=lambda function: -function["cumulative"])
+with open(stats_path, "w") as stats_file:
+    json.dump({"functions": functions[:500], "allocations": allocations, "peak": peak}, stats_file)
+sys.exit(exit_code)
+"""
+
+
+class ProfilePanel(QTabWidget):
+    # Hot functions and allocation sites from a profiled run, in sortable
+    # tables; rows in the editor's own code emit the line they point at
+    PROFILE_FILENAME = "<editor>"
+    line_selected = Signal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.functions_table = self.make_table(["Function", "Location", "Calls", "Own (ms)", "Total (ms)"])
+        self.allocations_table = self.make_table(["Location", "Size (KiB)", "Blocks"])
+        self.addTab(self.functions_table, "Hot Functions")
+        self.addTab(self.allocations_table, "Allocations")
+
+    def make_table(self, headers):
+        table = QTableWidget(0, len(headers), self)
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.itemClicked.connect(self.on_item_clicked)
+        return table
+
+    def location_item(self, file, line):
+        if file == self.PROFILE_FILENAME:
+            item = QTableWidgetItem(f"line {line}")
+            item.setData(Qt.UserRole, line)
+        else:
+            item = QTableWidgetItem(f"{os.path.basename(file)}:{line}" if line else file)
+            item.setForeground(QColor("#808080"))
+        return item
+
+    def number_item(self, value):
+        item = QTableWidgetItem()
+        item.setData(Qt.DisplayRole, value)
+        return item
+
+    def fill(self, table, rows):
+        table.setSortingEnabled(False)
+        table.setRowCount(len(rows))
+        for row, items in enumerate(rows):
+            for column, item in enumerate(items):
+                table.setItem(row, column, item)
+        table.setSortingEnabled(True)
+
+    def show_profile(self, profile):
+        self.fill(self.functions_table, [
+            [QTableWidgetItem(function["name"]), self.location_item(function["file"], function["line"]),
+             self.number_item(function["calls"]), self.number_item(round(function["total"] * 1000, 3)),
+             self.number_item(round(function["cumulative"] * 1000, 3))]
+            for function in profile["functions"]])
+        self.functions_table.sortItems(4, Qt.DescendingOrder)
+        self.fill(self.allocations_table, [
+            [self.location_item(site["file"], site["line"]), self.number_item(round(site["size"] / 1024, 1)),
+             self.number_item(site["count"])]
+            for site in profile["allocations"]])
+        self.allocations_table.sortItems(1, Qt.DescendingOrder)
+        self.setTabText(1, f"Allocations (peak {profile['peak'] / (1024 * 1024):.1f} MiB)")
+
+    def on_item_clicked(self, item):
+        for column in range(item.tableWidget().columnCount()):
+            line = item.tableWidget().item(item.row(), column).data(Qt.UserRole)
+            if line:
+                self.line_selected.emit(line)
+                return
+
+
+class CodeEditor(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Code Editor")
+        self.setGeometry(100, 100, 800, 600)
+
+        # Files load on a worker thread; the path and encoding are kept so
+        # Save writes the file back the way it was read
+        self.current_path = None
+        self.current_encoding = "utf-8"
+        self.load = None
+        self.load_count = 0
+        self.io_pool = QThreadPool(self)
+        self.io_pool.setMaxThreadCount(1)
+        self.load_signals = LoadSignals(self)
+        self.load_signals.chunk_ready.connect(self.on_chunk_loaded)
+        self.load_signals.restarted.connect(self.on_load_restarted)
+        self.load_signals.finished.connect(self.on_load_finished)
+
+        # The running script, if any, and how long it may run (0 = no limit)
+        self.process = None
+        self.profile_path = None
+        self.run_timeout = 0
+        self.run_clock = QElapsedTimer()
+        self.stop_reason = None
+
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.setTimerType(Qt.PreciseTimer)
+        self.timeout_timer.timeout.connect(lambda: self.stop_code(f"Timed out after {self.run_timeout}s"))
+
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(lambda: self.process.kill() if self.process is not None else None)
+
+        # Warm interpreters need fork() and fd passing, so POSIX only
+        self.preload_modules = []
+        self.warm_pool = WarmInterpreterPool(self.preload_modules, parent=self) \
+            if hasattr(os, "fork") and hasattr(socket, "send_fds") else None
+        
+        self.init_ui()
+        self.init_menu()
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #2e2e2e;
+            }
+            QPlainTextEdit {
+                background-color: #1e1e1e;
+                color: #dcdcdc;
+                border: 1px solid #444;
+                font-family: Courier New;
+                font-size: 12pt;
+            }
+            QPushButton {
+                background-color: #007acc;
+                color: white;
+                border: none;
+                padding: 10px;
+                font-size: 14pt;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #005f99;
+            }
+            QMenuBar {
+                background-color: #333;
+                color: white;
+            }
+            QMenuBar::item:selected {
+                background-color: #555;
+            }
+            QMenu {
+                background-color: #333;
+                color: white;
+            }
+            QMenu::item:selected {
+                background-color: #555;
+            }
+        """)
+
+    def init_ui(self):
+        self.splitter = QSplitter(Qt.Horizontal, self)
+        
+        self.text_area = QPlainTextEdit(self)
+        self.output_area = OutputPane(self)
+
+        # Apply syntax highlighting to text_area
+        self.highlighter = PythonHighlighter(self.text_area.document())
+
+        self.splitter.addWidget(self.text_area)
+        self.splitter.addWidget(self.output_area)
+
+        self.profile_panel = ProfilePanel(self)
+        self.profile_panel.line_selected.connect(self.go_to_line)
+        self.profile_panel.hide()
+        self.splitter.addWidget(self.profile_panel)
+        
+        self.run_button = QPushButton("Run Code", self)
+        self.run_button.clicked.connect(self.run_code)
+
+        self.profile_button = QPushButton("Profile", self)
+        self.profile_button.clicked.connect(lambda: self.run_code(profile=True))
+
+        self.stop_button = QPushButton("Stop", self)
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(lambda: self.stop_code("Stopped"))
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.run_button)
+        button_layout.addWidget(self.profile_button)
+        button_layout.addWidget(self.stop_button)
+
+        self.find_bar = FindBar(self.text_area, self)
+        self.find_bar.hide()
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.splitter)
+        layout.addWidget(self.find_bar)
+        layout.addLayout(button_layout)
+        layout.setStretch(0, 3)
+        layout.setStretch(1, 0)
+
+        container = QWidget()
+        container.setLayout(layout)
+        self.setCentralWidget(container)
+
+        self.load_progress = QProgressBar(self)
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.hide()
+        self.statusBar().addPermanentWidget(self.load_progress)
+
+    def init_menu(self):
+        menu_bar = self.menuBar()
+        
+        file_menu = menu_bar.addMenu("File")
+        
+        open_action = QAction("Open", self)
+        open_action.setShortcut(QKeySequence.Open)
+        open_action.triggered.connect(self.open_file)
+        file_menu.addAction(open_action)
+        
+        save_action = QAction("Save", self)
+        save_action.setShortcut(QKeySequence.Save)
+        save_action.triggered.connect(self.save_file)
+        file_menu.addAction(save_action)
+        
+        exit_action = QAction("Exit", self)
+        exit_action.setShortcut("Ctrl+Q")
+        exit_action.triggered.connect(self.exit_editor)
+        file_menu.addAction(exit_action)
+
+        edit_menu = menu_bar.addMenu("Edit")
+
+        find_action = QAction("Find", self)
+        find_action.setShortcut(QKeySequence.Find)
+        find_action.triggered.connect(lambda: self.find_bar.open_bar())
+        edit_menu.addAction(find_action)
+
+        replace_action = QAction("Replace", self)
+        replace_action.setShortcut("Ctrl+H")
+        replace_action.triggered.connect(lambda: self.find_bar.open_bar(replace=True))
+        edit_menu.addAction(replace_action)
+
+        find_next_action = QAction("Find Next", self)
+        find_next_action.setShortcut(QKeySequence.FindNext)
+        find_next_action.triggered.connect(lambda: self.find_bar.find_next())
+        edit_menu.addAction(find_next_action)
+
+        find_previous_action = QAction("Find Previous", self)
+        find_previous_action.setShortcut(QKeySequence.FindPrevious)
+        find_previous_action.triggered.connect(lambda: self.find_bar.find_next(backward=True))
+        edit_menu.addAction(find_previous_action)
+
+        run_menu = menu_bar.addMenu("Run")
+
+        run_action = QAction("Run", self)
+        run_action.setShortcut("F5")
+        run_action.triggered.connect(self.run_code)
+        run_menu.addAction(run_action)
+
+        profile_action = QAction("Profile", self)
+        profile_action.setShortcut("Ctrl+F5")
+        profile_action.triggered.connect(lambda: self.run_code(profile=True))
+        run_menu.addAction(profile_action)
+
+        stop_action = QAction("Stop", self)
+        stop_action.setShortcut("Shift+F5")
+        stop_action.triggered.connect(lambda: self.stop_code("Stopped"))
+        run_menu.addAction(stop_action)
+
+        timeout_action = QAction("Set Timeout...", self)
+        timeout_action.triggered.connect(self.set_run_timeout)
+        run_menu.addAction(timeout_action)
+
+        output_lines_action = QAction("Set Output Line Limit...", self)
+        output_lines_action.triggered.connect(self.set_output_lines)
+        run_menu.addAction(output_lines_action)
+
+        open_log_action = QAction("Open Full Output", self)
+        open_log_action.triggered.connect(self.open_output_log)
+        run_menu.addAction(open_log_action)
+
+        preload_action = QAction("Preload Modules...", self)
+        preload_action.setEnabled(self.warm_pool is not None)
+        preload_action.triggered.connect(self.set_preload_modules)
+        run_menu.addAction(preload_action)
+
+        view_menu = menu_bar.addMenu("View")
+
+        self.tokenizer_action = QAction("Tokenizer Highlighting", self)
+        self.tokenizer_action.setCheckable(True)
+        self.tokenizer_action.toggled.connect(self.set_tokenizer_highlighting)
+        view_menu.addAction(self.tokenizer_action)
+
+    def set_tokenizer_highlighting(self, enabled):
+        # Swap between the regex highlighter and the background tokenizer one
+        self.highlighter.setDocument(None)
+        self.highlighter.deleteLater()
+        if enabled:
+            self.highlighter = TokenHighlighter(self.text_area)
+        else:
+            self.highlighter = PythonHighlighter(self.text_area.document())
+
+    def open_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*);;Text Files (*.txt);;Python Files (*.py)")
+        if file_path:
+            self.load_file(file_path)
+
+    def load_file(self, file_path):
+        # The document fills in chunk by chunk while the worker reads ahead;
+        # it is read-only, without undo history, until the load completes
+        self.cancel_load()
+        self.load_count += 1
+        self.load = FileLoad(self.load_count)
+        self.load_path = file_path
+        document = self.text_area.document()
+        self.text_area.clear()
+        document.setUndoRedoEnabled(False)
+        self.text_area.setReadOnly(True)
+        self.load_cursor = QTextCursor(document)
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.statusBar().showMessage(f"Loading {file_path}...")
+        self.io_pool.start(partial(run_load_job, self.load, file_path, self.load_signals))
+
+    def on_chunk_loaded(self, load_id, text, percent):
+        if self.load is None or load_id != self.load.id:
+            return
+        self.load_cursor.movePosition(QTextCursor.End)
+        self.load_cursor.insertText(text)
+        self.load_progress.setValue(percent)
+        self.load.slots.release()
+
+    def on_load_restarted(self, load_id):
+        if self.load is None or load_id != self.load.id:
+            return
+        self.text_area.clear()
+        self.load_cursor = QTextCursor(self.text_area.document())
+        self.load_progress.setValue(0)
+
+    def on_load_finished(self, load_id, encoding, error):
+        if self.load is None or load_id != self.load.id:
+            return
+        self.end_load()
+        if error:
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "Error", error)
+            return
+        self.current_path = self.load_path
+        self.current_encoding = encoding
+        self.text_area.moveCursor(QTextCursor.Start)
+        self.statusBar().showMessage(f"Opened {self.current_path} ({encoding})", 5000)
+
+    def cancel_load(self):
+        if self.load is not None:
+            self.load.cancelled.set()
+            self.end_load()
+
+    def end_load(self):
+        self.load = None
+        self.load_cursor = None
+        self.text_area.document().setUndoRedoEnabled(True)
+        self.text_area.setReadOnly(False)
+        self.load_progress.hide()
+
+    def save_file(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save File", self.current_path or "", "All Files (*);;Text Files (*.txt);;Python Files (*.py)")
+        if file_path and self.load is not None:
+            QMessageBox.information(self, "Save", "The file is still loading.")
+        elif file_path:
+            try:
+                try:
+                    save_document(self.text_area.document(), file_path, self.current_encoding)
+                except UnicodeEncodeError as e:
+                    # Typed text the file's encoding can't hold (e.g. a Latin-1 fallback)
+                    if QMessageBox.question(self, "Save", f"The text can't be saved as {self.current_encoding} "
+                                            f"({e.reason}). Save it as UTF-8 instead?",
+                                            QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+                        return
+                    save_document(self.text_area.document(), file_path, "utf-8")
+                    self.current_encoding = "utf-8"
+                self.current_path = file_path
+                self.statusBar().showMessage(f"Saved {file_path} ({self.current_encoding})", 5000)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", str(e))
+
+    def exit_editor(self):
+        if QMessageBox.question(self, "Quit", "Do you want to quit?", QMessageBox.Yes | QMessageBox.No) == QMessageBox.Yes:
+            self.close()
+
+    def run_code(self, profile=False):
+        # Run the script in a QProcess and stream its output as it arrives;
+        # the editor stays usable while it runs
+        if self.process is not None:
+            return
+        self.output_area.clear_output()
+        self.stop_reason = None
+        self.decoders = {}
+        self.run_button.setEnabled(False)
+        self.profile_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.run_clock.start()
+        if self.run_timeout > 0:
+            self.timeout_timer.start(self.run_timeout * 1000)
+
+        code = self.text_area.toPlainText()
+        arguments = ["-u", "-c", code]
+        if profile:
+            # Profiled runs always get a fresh interpreter, which writes its
+            # results to a temp file read back when it exits
+            handle, self.profile_path = tempfile.mkstemp(prefix="code-editor-profile-", suffix=".json")
+            os.close(handle)
+            arguments = ["-u", "-c", PROFILER_SOURCE, self.profile_path, code]
+        self.process = self.warm_pool.start_run(code, self) if self.warm_pool is not None and not profile else None
+        if self.process is not None:
+            self.process.text_ready.connect(self.append_output)
+            self.process.finished.connect(self.on_process_finished)
+            return
+
+        # No warm interpreter free: start a fresh one
+        self.decoders = {channel: codecs.getincrementaldecoder("utf-8")(errors="replace")
+                         for channel in (QProcess.StandardOutput, QProcess.StandardError)}
+        self.process = QProcess(self)
+        self.process.readyReadStandardOutput.connect(lambda: self.read_output(QProcess.StandardOutput))
+        self.process.readyReadStandardError.connect(lambda: self.read_output(QProcess.StandardError))
+        self.process.finished.connect(self.on_process_finished)
+        self.process.errorOccurred.connect(self.on_process_error)
+        # -u: unbuffered, so print() output shows up straight away
+        self.process.start(sys.executable, arguments)
+        # Nothing is ever typed in: input() gets EOF, as in a warm run
+        self.process.closeWriteChannel()
+
+    def read_output(self, channel):
+        self.process.setReadChannel(channel)
+        text = self.decoders[channel].decode(self.process.readAll().data())
+        if text:
+            self.append_output(text)
+
+    def append_output(self, text):
+        self.output_area.append(text)
+
+    def stop_code(self, reason):
+        # Ask politely first, then kill if it has not gone after two seconds
+        if self.process is None:
+            return
+        self.stop_reason = reason
+        self.process.terminate()
+        self.kill_timer.start(2000)
+
+    def on_process_finished(self, exit_code, exit_status):
+        for channel in self.decoders:
+            self.read_output(channel)
+        seconds = self.run_clock.elapsed() / 1000
+        if self.stop_reason:
+            status = self.stop_reason
+        elif exit_status == QProcess.CrashExit:
+            status = "Crashed"
+        else:
+            status = f"Exited with code {exit_code}"
+        self.append_output(f"\n[{status}, ran for {seconds:.2f}s]\n")
+        if self.profile_path is not None:
+            self.show_profile()
+        self.output_area.flush()
+        self.reset_process()
+
+    def show_profile(self):
+        try:
+            with open(self.profile_path, "r", encoding="utf-8") as profile_file:
+                profile = json.load(profile_file)
+        except (OSError, ValueError):
+            self.append_output("[No profile data: the script did not finish normally]\n")
+            return
+        self.profile_panel.show_profile(profile)
+        self.profile_panel.show()
+
+    def go_to_line(self, line):
+        block = self.text_area.document().findBlockByNumber(line - 1)
+        if block.isValid():
+            cursor = QTextCursor(block)
+            cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            self.text_area.setTextCursor(cursor)
+            self.text_area.centerCursor()
+            self.text_area.setFocus()
+
+    def on_process_error(self, error):
+        if error == QProcess.FailedToStart:
+            self.append_output(f"[Failed to start: {self.process.errorString()}]\n")
+            self.reset_process()
+
+    def reset_process(self):
+        self.timeout_timer.stop()
+        self.kill_timer.stop()
+        self.process.deleteLater()
+        self.process = None
+        if self.profile_path is not None:
+            os.unlink(self.profile_path)
+            self.profile_path = None
+        self.run_button.setEnabled(True)
+        self.profile_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+
+    def set_preload_modules(self):
+        modules, ok = QInputDialog.getText(self, "Preload Modules", "Modules imported by the warm interpreter "
+                                           "(comma-separated):", text=", ".join(self.preload_modules))
+        if ok:
+            self.preload_modules = [name.strip() for name in modules.split(",") if name.strip()]
+            self.warm_pool.set_modules(self.preload_modules)
+
+    def set_run_timeout(self):
+        timeout, ok = QInputDialog.getInt(self, "Run Timeout", "Stop scripts after this many seconds (0 = never):",
+                                          self.run_timeout, 0, 24 * 60 * 60)
+        if ok:
+            self.run_timeout = timeout
+
+    def set_output_lines(self):
+        max_lines, ok = QInputDialog.getInt(self, "Output Line Limit", "Lines kept in the output pane:",
+                                            self.output_area.max_lines, 100, 10000000)
+        if ok:
+            self.output_area.set_max_lines(max_lines)
+
+    def open_output_log(self):
+        if self.output_area.open_log() is None:
+            QMessageBox.information(self, "Output", "There is no output yet.")
+
+    def closeEvent(self, event):
+        if self.process is not None:
+            self.process.kill()
+            if isinstance(self.process, QProcess):
+                self.process.waitForFinished(1000)
+        if self.warm_pool is not None:
+            self.warm_pool.close()
+        self.cancel_load()
+        self.output_area.close_log()
+        super().closeEvent(event)
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    editor = CodeEditor()
+    editor.show()
+    sys.exit(app.exec())
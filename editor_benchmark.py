@@ -0,0 +1,318 @@
+import os
+
+# Run Qt without a display; must be set before PySide6 is imported
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from PySide6.QtCore import Qt, QObject, QEvent
+from PySide6.QtWidgets import QApplication
+from PySide6.QtTest import QTest
+
+from benchmark_common import compare_entries, compare_sizes, git_revision, summarize
+
+EDITOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code-editor_1.py")
+DEFAULT_SIZES = [1000, 10000, 100000]
+RUN_SCRIPT = 'print("ready")\n'
+
+# Runs in a fresh interpreter so imports and first paint are really cold;
+# prints the time each startup phase finished, in seconds since it started
+STARTUP_PROBE = r"""
+import time
+started = time.perf_counter()
+import importlib.util, json, sys
+phases = {}
+spec = importlib.util.spec_from_file_location("code_editor", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+phases["import"] = time.perf_counter() - started
+from PySide6.QtCore import QObject, QEvent
+
+
+class ProbeEditor(module.CodeEditor):
+    def timed(self, name, function, *args):
+        phase_started = time.perf_counter()
+        function(*args)
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - phase_started
+
+    def init_ui(self):
+        self.timed("init_ui", super().init_ui)
+
+    def init_menu(self):
+        self.timed("init_menu", super().init_menu)
+
+    def setStyleSheet(self, sheet):
+        self.timed("stylesheet", super().setStyleSheet, sheet)
+
+
+class PaintWatcher(QObject):
+    painted = False
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            self.painted = True
+        return False
+
+
+app = module.QApplication(sys.argv[:1])
+editor = ProbeEditor()
+phases["construct"] = time.perf_counter() - started
+watcher = PaintWatcher()
+editor.text_area.viewport().installEventFilter(watcher)
+editor.show()
+while not watcher.painted:
+    app.processEvents()
+phases["first_paint"] = time.perf_counter() - started
+editor.close()
+print(json.dumps(phases))
+"""
+
+
+def load_editor():
+    # The editor's file name is not a valid module name
+    spec = importlib.util.spec_from_file_location("code_editor", EDITOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_source(file_path, lines, seed=0):
+    # Synthetic Python with a realistic mix of keywords, strings, comments
+    # and the odd multi-line string
+    rng = random.Random(seed)
+    with open(file_path, "w", encoding="utf-8") as source_file:
+        line = 0
+        while line < lines:
+            name = f"function_{line}"
+            chunk = [
+                f"def {name}(value, limit={rng.randint(1, 100)}):\n",
+                '    """Docstring for a generated function\n',
+                '    spanning two lines."""\n',
+                f"    # Comment number {line}\n",
+                "    if value > limit and value is not None:\n",
+                f"        return 'string {rng.random():.6f}' + str(value)\n",
+                "    for item in range(limit):\n",
+                f"        value += item * {rng.randint(1, 9)}\n",
+                "    return value\n",
+                "\n",
+            ]
+            source_file.writelines(chunk[:lines - line])
+            line += len(chunk)
+
+
+class PaintWatcher(QObject):
+    # Counts paint events on the editor's viewport
+    def __init__(self, widget):
+        super().__init__(widget)
+        self.paints = 0
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            self.paints += 1
+        return False
+
+
+def wait_until(app, condition, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark step did not complete")
+        app.processEvents()
+
+
+def until_repaint(app, watcher, action):
+    # Seconds from running action to the viewport having been repainted
+    paints = watcher.paints
+    started = time.perf_counter()
+    action()
+    wait_until(app, lambda: watcher.paints > paints)
+    app.processEvents()
+    return time.perf_counter() - started
+
+
+def type_key(widget, character):
+    # QTest cannot map "\n" to a key by itself
+    if character == "\n":
+        QTest.keyClick(widget, Qt.Key_Return)
+    else:
+        QTest.keyClick(widget, character)
+
+
+def benchmark_startup(runs):
+    phases = {}
+    wall = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_PROBE, EDITOR_PATH], capture_output=True,
+                                text=True, check=True).stdout
+        wall.append(time.perf_counter() - started)
+        for name, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            phases.setdefault(name, []).append(seconds)
+    results = {name: summarize(samples) for name, samples in phases.items()}
+    results["process"] = summarize(wall)
+    return results
+
+
+def benchmark_size(app, editor_module, lines, keystrokes, work_dir):
+    source_path = os.path.join(work_dir, "benchmark_source.py")
+    generate_source(source_path, lines)
+    results = {"lines": lines, "file_bytes": os.path.getsize(source_path)}
+
+    editor = editor_module.CodeEditor()
+    editor.show()
+    app.processEvents()
+    watcher = PaintWatcher(editor.text_area.viewport())
+
+    # Time every highlightBlock call, whether from loading, typing or a full
+    # rehighlight
+    block_samples = []
+
+    class TimedHighlighter(editor_module.PythonHighlighter):
+        def highlightBlock(self, text):
+            started = time.perf_counter()
+            super().highlightBlock(text)
+            block_samples.append(time.perf_counter() - started)
+
+    editor.highlighter.setDocument(None)
+    editor.highlighter = TimedHighlighter(editor.text_area.document())
+
+    # open_file without its dialog: from the call to the first chunk on
+    # screen, and to the whole file being loaded
+    first_chunk, complete = [], []
+    for _ in range(3):
+        started = time.perf_counter()
+        editor.load_file(source_path)
+        wait_until(app, lambda: editor.text_area.document().characterCount() > 1 or editor.load is None)
+        first_chunk.append(time.perf_counter() - started)
+        wait_until(app, lambda: editor.load is None)
+        complete.append(time.perf_counter() - started)
+    results["open_file_first_chunk"] = summarize(first_chunk)
+    results["open_file"] = summarize(complete)
+    app.processEvents()
+
+    del block_samples[:]
+    started = time.perf_counter()
+    editor.highlighter.rehighlight()
+    results["rehighlight"] = {"seconds": time.perf_counter() - started}
+    results["highlight_block"] = summarize(block_samples)
+
+    # Keystroke to repaint, typing a new line of code in the middle of the file
+    text_area = editor.text_area
+    cursor = text_area.textCursor()
+    cursor.setPosition(text_area.document().findBlockByNumber(lines // 2).position())
+    text_area.setTextCursor(cursor)
+    text_area.ensureCursorVisible()
+    app.processEvents()
+    typed = "value = other + 'text' # comment\n"
+    results["keystroke"] = summarize([until_repaint(app, watcher, lambda: type_key(text_area, key))
+                                      for key in (typed * (keystrokes // len(typed) + 1))[:keystrokes]])
+
+    # Scrolling a page at a time from the top
+    scroll_bar = text_area.verticalScrollBar()
+    scroll_bar.setValue(0)
+    app.processEvents()
+    steps = min(keystrokes, max(1, scroll_bar.maximum() // max(1, scroll_bar.pageStep())))
+    results["scroll_page"] = summarize([
+        until_repaint(app, watcher, lambda: scroll_bar.setValue(scroll_bar.value() + scroll_bar.pageStep()))
+        for _ in range(steps)])
+
+    # run_code on a trivial script: to the first line of output and to exit,
+    # warm (when available) and cold
+    text_area.setPlainText(RUN_SCRIPT)
+    warm_pool = editor.warm_pool
+    modes = [("cold", None)]
+    if warm_pool is not None:
+        wait_until(app, lambda: warm_pool.current.ready)
+        modes.insert(0, ("warm", warm_pool))
+    for mode, pool in modes:
+        editor.warm_pool = pool
+        first_output, finished = [], []
+        for _ in range(10):
+            if pool is not None:
+                wait_until(app, lambda: pool.current.ready and not pool.current.busy)
+            started = time.perf_counter()
+            editor.run_code()
+            wait_until(app, lambda: editor.output_area.pending or editor.output_area.blockCount() > 1)
+            first_output.append(time.perf_counter() - started)
+            wait_until(app, lambda: editor.process is None)
+            finished.append(time.perf_counter() - started)
+        results[f"run_code_{mode}_first_output"] = summarize(first_output)
+        results[f"run_code_{mode}"] = summarize(finished)
+    editor.warm_pool = warm_pool
+
+    editor.close()
+    editor.deleteLater()
+    app.processEvents()
+    return results
+
+
+def compare(results, baseline):
+    # Print the ratio of every latency/time metric against a previous run
+    print("--- startup ---")
+    compare_entries(baseline.get("startup", {}), results["startup"])
+    compare_sizes(results, baseline, "lines")
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Benchmark code-editor_1.py startup and input latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="file sizes in lines (default: 1000 10000 100000)")
+    parser.add_argument("--keystrokes", type=int, default=200,
+                        help="keystrokes (and at most as many page scrolls) timed per size (default: 200)")
+    parser.add_argument("--startups", type=int, default=5, help="cold starts to time (default: 5)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="print ratios against an earlier JSON result")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "keystrokes": args.keystrokes,
+        "sizes": [],
+    }
+    print("Timing cold starts...", file=sys.stderr)
+    results["startup"] = benchmark_startup(args.startups)
+
+    app = QApplication.instance() or QApplication([])
+    editor_module = load_editor()
+    for lines in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix="editor-bench-")
+        try:
+            print(f"Benchmarking a {lines}-line file...", file=sys.stderr)
+            results["sizes"].append(benchmark_size(app, editor_module, lines, args.keystrokes, work_dir))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    # ru_maxrss is in kilobytes on Linux
+    results["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,162 @@
+import os
+
+# Run Qt without a display; must be set before PySide6 is imported
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import csv
+import json
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QPixmap
+
+import Transaction
+from benchmark_common import compare_sizes, git_revision, summarize
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+
+
+def generate_ledger(file_path, rows, seed=0):
+    # Synthetic ledger in the same format save_transaction writes
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    with open(file_path, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(Transaction.LEDGER_HEADER)
+        for row in range(rows):
+            timestamp = start + timedelta(seconds=row * 30)
+            csv_writer.writerow([rng.choice(Transaction.PAYMENT_METHODS), round(rng.uniform(1, 500), 2),
+                                 f'{rng.randint(100000, 999999)}', timestamp.strftime('%Y-%m-%d %H:%M:%S')])
+
+
+def time_calls(function, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def measure_peak(function):
+    # Seconds taken and peak Python allocations (bytes) of one call
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark_size(app, rows, payments, work_dir):
+    ledger_path = os.path.join(work_dir, 'transaction_records.csv')
+    export_path = os.path.join(work_dir, 'payment_history.csv')
+    generate_ledger(ledger_path, rows)
+    results = {'rows': rows, 'ledger_bytes': os.path.getsize(ledger_path)}
+
+    # Cold start: opening the store, restoring aggregates and building the UI
+    def open_dialog():
+        store = Transaction.CsvTransactionStore(ledger_path)
+        processor = Transaction.PaymentProcessor(store, export_path=export_path)
+        return Transaction.PaymentDialog(processor=processor)
+
+    dialog, elapsed, peak = measure_peak(open_dialog)
+    results['cold_start'] = {'seconds': elapsed, 'peak_bytes': peak}
+    processor = dialog.processor
+
+    methods = Transaction.PAYMENT_METHODS
+    amounts = [round(random.uniform(1, 500), 2) for _ in range(payments)]
+    results['save_transaction'] = time_calls(
+        lambda: processor.save_transaction(random.choice(methods), random.choice(amounts),
+                                           processor.generate_bill_id()), payments)
+    results['get_latest_transaction'] = time_calls(processor.get_latest_transaction, payments)
+    results['export_to_csv'] = time_calls(processor.export_to_csv, payments)
+    for method in methods:
+        results[f'pay:{method}'] = time_calls(lambda: processor.pay(method, random.choice(amounts)), payments)
+
+    # The QR pipeline as execute_qr_payment runs it, end to end but synchronously
+    def qr_pipeline():
+        bill_id = processor.generate_bill_id('QR Code')
+        image = Transaction.build_qr_image(processor.generate_qr_data(random.choice(amounts), bill_id))
+        QPixmap.fromImage(image)
+
+    results['qr_pipeline'] = time_calls(qr_pipeline, max(1, payments // 4))
+
+    # History: build the dialog and paint the first screen of rows
+    def open_history():
+        history_dialog = dialog.build_history_dialog()
+        history_dialog.show()
+        app.processEvents()
+        return history_dialog
+
+    history_dialog, elapsed, peak = measure_peak(open_history)
+    results['history_open'] = {'seconds': elapsed, 'peak_bytes': peak}
+    history_dialog.close()
+
+    dialog.done(0)
+    app.processEvents()
+    return results
+
+
+def compare(results, baseline):
+    # Print the ratio of every latency/time metric against a previous run
+    compare_sizes(results, baseline, 'rows')
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the Transaction.py hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='ledger sizes in rows (default: 1000 100000 1000000)')
+    parser.add_argument('--payments', type=int, default=200,
+                        help='payments timed per operation and size (default: 200)')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='print ratios against an earlier JSON result')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_arguments(argv)
+    app = QApplication.instance() or QApplication([])
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'payments': args.payments,
+        'sizes': [],
+    }
+    for rows in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix='transaction-bench-')
+        try:
+            print(f'Benchmarking a {rows}-row ledger...', file=sys.stderr)
+            results['sizes'].append(benchmark_size(app, rows, args.payments, work_dir))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    # ru_maxrss is in kilobytes on Linux
+    results['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])